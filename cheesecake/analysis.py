@@ -0,0 +1,312 @@
+"""Analysis of package source files shared by Cheesecake steps and indices.
+
+Every Python file is read, tokenized and parsed at most once per run, no
+matter how many indices need to look at it.
+"""
+
+import multiprocessing
+import os
+import tokenize
+from cStringIO import StringIO
+
+import logger
+from codeparser import CodeParser
+from model import parse
+from util import hash_key
+from __init__ import __version__ as VERSION
+
+# Bump when CodeParser results change for the same source, to invalidate
+# persistent caches.
+CODEPARSER_CACHE_FORMAT = 6
+
+# Marks results which couldn't be computed, so they aren't tried again.
+FAILED = object()
+
+
+class SourceFile(object):
+    """Lazily computed analysis of a single Python source file.
+
+    Available attributes:
+      source : str
+          Contents of the file.
+      lines : list
+          Source lines, as returned by file.readlines().
+      tokens : list
+          Tokens generated by tokenize module, None if file can't be
+          tokenized.
+      ast : ast.Module
+          Parsed module, None if file can't be parsed.
+      code : CodeParser
+          Information about module structure (with its `model.System`).
+
+    If `cache` (a `util.DiskCache` instance) is given, `code` is looked up
+    there by a hash of the source and stored there after parsing. Parsers
+    coming from the cache don't have the `model.System` result.
+
+    If `source` is given, the file isn't read at all.
+    """
+    def __init__(self, path, log=None, cache=None, source=None):
+        self.path = path
+        self.log = log
+        self.cache = cache
+
+        self._source = source
+        self._lines = None
+        self._tokens = None
+        self._ast = None
+        self._code = None
+
+    def _get_source(self):
+        if self._source is None:
+            fd = open(self.path)
+            self._source = fd.read()
+            fd.close()
+        return self._source
+
+    source = property(_get_source)
+
+    def _get_lines(self):
+        if self._lines is None:
+            self._lines = StringIO(self.source).readlines()
+        return self._lines
+
+    lines = property(_get_lines)
+
+    def _get_tokens(self):
+        if self._tokens is None:
+            try:
+                self._tokens = list(tokenize.generate_tokens(
+                    iter(self.lines).next))
+            except (tokenize.TokenError, SyntaxError, IOError, OSError):
+                # Leave error reporting to the consumer, which will
+                # tokenize the file by itself.
+                self._tokens = FAILED
+        if self._tokens is FAILED:
+            return None
+        return self._tokens
+
+    tokens = property(_get_tokens)
+
+    def _get_ast(self):
+        if self._ast is None:
+            try:
+                # Normalize newlines, the same way model.parseFile does.
+                source = self.source.replace('\r\n', '\n').replace('\r', '\n')
+                self._ast = parse(source + '\n')
+            except Exception:
+                # Unreadable or invalid file. CodeParser will try it again
+                # and log the error.
+                self._ast = FAILED
+        if self._ast is FAILED:
+            return None
+        return self._ast
+
+    ast = property(_get_ast)
+
+    def _get_code(self):
+        if self._code is None:
+            if not self.load_cached_code():
+                self.set_code(CodeParser(self.path, self.log, self.ast))
+        return self._code
+
+    def _cache_key(self):
+        # Module name is part of all object names, so it goes into the key.
+        module = os.path.splitext(os.path.basename(self.path))[0]
+        try:
+            return hash_key(VERSION, str(CODEPARSER_CACHE_FORMAT), module,
+                            self.source)
+        except IOError:
+            return None
+
+    def load_cached_code(self):
+        """Try to get `code` from the persistent cache.
+
+        Return True on success and False otherwise.
+        """
+        if self.cache is None:
+            return False
+
+        key = self._cache_key()
+        if key is None:
+            return False
+
+        summary = self.cache.get(key)
+        if summary is None:
+            return False
+
+        if self.log:
+            self.log("Using cached parsing results for %s" % self.path)
+        self._code = CodeParser.from_summary(summary, self.log)
+        return True
+
+    def set_code(self, code):
+        """Set `code` to given CodeParser instance and store its results in
+        the persistent cache.
+        """
+        self._code = code
+
+        if self.cache is not None:
+            key = self._cache_key()
+            if key is not None:
+                self.cache.set(key, code.summary())
+
+    code = property(_get_code)
+
+
+class CallGraph(object):
+    """Index of names of functions and classes called from source files.
+
+    Names of package objects are prefixed only with the name of their module
+    file (see CodeParser), while imports may use the whole package path. So
+    a call to "function" imported from "package.module" is recorded under
+    "module.function" as well. Names which weren't resolved through imports,
+    like "self.parser.parse", are recorded only as written.
+    """
+    def __init__(self):
+        # Path -> names called from that file.
+        self.calls = {}
+        # Name -> paths of files calling it.
+        self.callers = {}
+
+    def __contains__(self, path):
+        return path in self.calls
+
+    def update(self, path, references, imported_references=()):
+        """Record names called from file at `path`, replacing anything
+        recorded for it before.
+
+        `imported_references` are those of the names which are full names
+        of imported objects.
+        """
+        self.remove(path)
+
+        names = set(references)
+        for reference in imported_references:
+            names.add(reference)
+            parts = reference.split('.')
+            for i in range(1, len(parts) - 1):
+                names.add('.'.join(parts[i:]))
+
+        self.calls[path] = names
+        for name in names:
+            self.callers.setdefault(name, set()).add(path)
+
+    def remove(self, path):
+        """Forget names called from file at `path`.
+        """
+        for name in self.calls.pop(path, ()):
+            callers = self.callers[name]
+            callers.discard(path)
+            if not callers:
+                del self.callers[name]
+
+    def reached(self, paths, names):
+        """Return dictionary mapping each of `paths` to a list of those
+        `names` which are called from that file.
+        """
+        reached = dict([(path, []) for path in paths])
+        for name in names:
+            for path in self.callers.get(name, ()):
+                if path in reached:
+                    reached[path].append(name)
+        return reached
+
+
+class AnalysisCache(object):
+    """Collection of `SourceFile` objects keyed by file path.
+
+    Optional `parser_cache` is a `util.DiskCache` instance used to persist
+    CodeParser results between runs. Optional `sources` dictionary maps
+    paths of files which exist only in memory to their contents.
+    """
+    def __init__(self, log=None, parser_cache=None, sources=None):
+        self.log = log
+        self.parser_cache = parser_cache
+        self.sources = sources or {}
+        self.files = {}
+        self.calls = CallGraph()
+
+    def source_file(self, path):
+        """Return `SourceFile` for given path, creating it when needed.
+        """
+        if path not in self.files:
+            self.files[path] = SourceFile(path, self.log, self.parser_cache,
+                                          self.sources.get(path))
+        return self.files[path]
+
+    def __contains__(self, path):
+        return path in self.files
+
+    def invalidate(self, path):
+        """Forget everything known about file at `path`, so that it is
+        analyzed again next time it's needed.
+        """
+        self.files.pop(path, None)
+        self.calls.remove(path)
+
+    def call_graph(self, paths):
+        """Return `CallGraph` shared by all users of this cache, with calls
+        from given files in it.
+
+        Files are added to the graph only the first time they're asked for.
+        """
+        for path in paths:
+            if path not in self.calls:
+                code = self.source_file(path).code
+                self.calls.update(path, code.references,
+                                  code.imported_references)
+        return self.calls
+
+    def parse(self, paths, jobs=1):
+        """Make `code` of given files available, parsing them with a pool
+        of `jobs` processes.
+
+        Files which already have been parsed, or whose results are in the
+        persistent cache, are not parsed again.
+        """
+        pending = []
+        for path in paths:
+            source = self.source_file(path)
+            if source._code is None and not source.load_cached_code():
+                pending.append(path)
+
+        if jobs <= 1 or len(pending) <= 1:
+            for path in pending:
+                self.source_file(path).code
+            return
+
+        # Worker processes log to the same place, so pass them the logger
+        # keywords (producers themselves can't be pickled).
+        log_keywords = getattr(self.log, 'keywords', None)
+
+        pool = multiprocessing.Pool(min(jobs, len(pending)))
+        try:
+            summaries = pool.map(parse_summary,
+                                 [(path, self.sources.get(path), log_keywords)
+                                  for path in pending])
+        finally:
+            pool.close()
+            pool.join()
+
+        for path, summary in zip(pending, summaries):
+            self.source_file(path).set_code(CodeParser.from_summary(summary,
+                                                                    self.log))
+
+
+def parse_summary(args):
+    """Parse Python file and return summary of CodeParser results.
+
+    Used by `AnalysisCache.parse` worker processes, `args` is a tuple of
+    file path, its contents (None if it should be read from disk) and
+    logger keywords.
+    """
+    path, source, log_keywords = args
+
+    log = None
+    if log_keywords:
+        log = logger.MultipleProducer(log_keywords)
+
+    ast = None
+    if source is not None:
+        ast = SourceFile(path, log, source=source).ast
+    return CodeParser(path, log, ast).summary()
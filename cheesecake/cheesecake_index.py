@@ -17,9 +17,10 @@ import re
 import shutil
 import sys
 import tempfile
+import time
+import traceback
 
 from argparse import ArgumentParser
-from urllib import urlretrieve
 from urlparse import urlparse
 from math import ceil
 
@@ -29,11 +30,18 @@ from util import (pad_with_dots, pad_left_spaces, pad_right_spaces, pad_msg,
                   pad_line)
 from util import run_cmd, command_successful
 from util import unzip_package, untar_package, unegg_package
+from util import read_zip_package, read_tar_package, read_egg_package
 from util import mkdirs
 from util import StdoutRedirector
 from util import time_function
 from util import rmtree
+from util import ArtifactCache, DiskCache, hash_key, hash_file, COPY_CHUNK_SIZE
+from util import InstallRootPool
+from util import ThreadCall, ProcessCall, ProcessCallError, first_finished
+from util import thread_map
 from codeparser import CodeParser
+from downloader import HTTPError, conditional_headers, urlretrieve
+from analysis import AnalysisCache
 from __init__ import __version__ as VERSION
 import pep8
 
@@ -203,6 +211,42 @@ def get_package_name_and_type(package, known_extensions):
             return package[:package.rfind('.'+package_type)], package_type
 
 
+# Package indices shared by all packages scored in this process, by URL.
+package_indices = {}
+
+def get_package_index(index_url=None):
+    """Return setuptools PackageIndex for `index_url`, shared by all
+    packages downloaded in this process.
+
+    Index remembers pages it has already read, so that looking for a package
+    again (in another fetch mode or for another package) doesn't fetch them
+    for the second time. Locally installed packages are not included.
+    """
+    from setuptools.package_index import PackageIndex
+
+    if index_url not in package_indices:
+        if index_url:
+            package_indices[index_url] = PackageIndex(index_url, search_path=[])
+        else:
+            package_indices[index_url] = PackageIndex(search_path=[])
+    return package_indices[index_url]
+
+
+# Versions of commands installing packages, by command and PATH.
+installer_versions = {}
+
+def get_installer_version(command):
+    """Return version of `command` found on PATH, as printed by its
+    --version option.
+
+    Version is asked for only once per process and PATH.
+    """
+    key = (command, os.getenv('PATH'))
+    if key not in installer_versions:
+        rc, output = run_cmd("%s --version" % command, max_timeout=60)
+        installer_versions[key] = str(output).strip()
+    return installer_versions[key]
+
 def get_method_arguments(method):
     """Return tuple of arguments for given method, excluding self.
 
@@ -279,6 +323,21 @@ def index_class_to_name(clsname):
     return camel2underscore(clsname.replace('Index', '', 1))
 
 
+def is_pinned_requirement(requirement):
+    """Return True if `requirement` allows only one exact version.
+
+    >>> is_pinned_requirement("cheesecake==0.6.1")
+    True
+    >>> is_pinned_requirement("cheesecake")
+    False
+    >>> is_pinned_requirement("cheesecake>=0.6")
+    False
+    >>> is_pinned_requirement("cheesecake==0.6.*")
+    False
+    """
+    return re.match(r'^[^<>=!~,]+==[^<>=!~,*]+$', requirement) is not None
+
+
 def is_empty(path):
     """Returns True if file or directory pointed by `path` is empty.
     """
@@ -433,6 +492,13 @@ class Index(object):
     details = ""
     info = ""
 
+    # How to compute this index in background when Cheesecake runs with
+    # more than one job: 'thread' for indices which mostly wait for
+    # subprocesses, 'process' for CPU-bound ones and None for indices which
+    # are cheap enough to compute in place.
+    concurrency = None
+    _call = None
+
     def __init__(self, *indices):
         # When indices are given explicitly they override the default.
         if indices:
@@ -473,11 +539,42 @@ class Index(object):
 
     def compute_with(self, cheesecake):
         """Take given Cheesecake instance and compute index value.
+
+        If the index is already being computed in background (see
+        `start_concurrent_indices`), wait for the result.
         """
         self.cheesecake = cheesecake
+        if self._call is not None:
+            call, self._call = self._call, None
+            ret, self.value, self.details, self.info = call.result()
+            return ret
         return self.compute(**get_attributes(cheesecake,
                                              self._compute_arguments))
 
+    def _compute_result(self, cheesecake):
+        self.cheesecake = cheesecake
+        ret = self.compute(**get_attributes(cheesecake,
+                                            self._compute_arguments))
+        return ret, self.value, self.details, self.info
+
+    def start_concurrent_indices(self, cheesecake):
+        """Start computing subindices which declare `concurrency` in
+        background.
+
+        Indices only read Cheesecake attributes provided by steps, which all
+        have been run at this point, so they don't depend on each other.
+        Results are collected by `compute_with` in the usual order, so
+        scores and printed output are the same as in sequential run.
+        """
+        calls = {'thread': ThreadCall, 'process': ProcessCall}
+
+        for index in self.subindices:
+            if index.subindices:
+                index.start_concurrent_indices(cheesecake)
+            elif index.concurrency and index._call is None:
+                function = lambda index=index: index._compute_result(cheesecake)
+                index._call = calls[index.concurrency](function)
+
     def compute(self):
         """Compute index value and return it.
 
@@ -489,6 +586,8 @@ class Index(object):
 
         :Warning: Don't use \*args and \*\*kwds arguments for this method.
         """
+        if getattr(self.cheesecake, 'jobs', 1) > 1:
+            self.start_concurrent_indices(self.cheesecake)
         self.value = sum(self._iter_indices())
         return self.value
 
@@ -526,6 +625,26 @@ class Index(object):
 
     max_value = property(_get_max_value)
 
+    def _get_requires_extraction(self):
+        for index in self.subindices:
+            if index.requires_extraction:
+                return True
+        return False
+
+    # Indices which need package files extracted on disk (instead of only
+    #     reading the package archive) override this with True.
+    requires_extraction = property(_get_requires_extraction)
+
+    def _get_requires_all_files(self):
+        for index in self.subindices:
+            if index.requires_all_files:
+                return True
+        return False
+
+    # Indices which need contents of all extracted files, not only of Python
+    #     modules, override this with True.
+    requires_all_files = property(_get_requires_all_files)
+
     def _get_requirements(self):
         if self.subindices:
             return list(self._compute_arguments) + \
@@ -637,13 +756,18 @@ def Doc(name):
 class FilesIndex(Index):
     _used_rules = []
 
-    def _compute_from_rules(self, files_list, package_dir, files_rules):
+    def _compute_from_rules(self, files_list, package_dir, files_rules,
+                            empty_paths=None):
         self._used_rules = []
         files_count = 0
         value = 0
 
         for filename in files_list:
-            if not is_empty(os.path.join(package_dir, filename)):
+            if empty_paths is None:
+                empty = is_empty(os.path.join(package_dir, filename))
+            else:
+                empty = filename in empty_paths
+            if not empty:
                 score = self.get_score(os.path.basename(filename), files_rules)
                 if score != 0:
                     value += score
@@ -772,10 +896,11 @@ class IndexSetupPy(FilesIndex):
         'setup.py': 25,
     }
 
-    def compute(self, files_list, package_dir):
+    def compute(self, files_list, package_dir, empty_paths=None):
         setup_py_found, self.value = self._compute_from_rules(files_list,
                                                               package_dir,
-                                                              self.files_rules)
+                                                              self.files_rules,
+                                                              empty_paths)
 
         if setup_py_found:
             self.details = "setup.py found"
@@ -792,6 +917,8 @@ class IndexInstall(Index):
     """Check if package can be installed via "python setup.py" command.
     """
     max_value = 50
+    requires_extraction = True
+    requires_all_files = True
 
     def compute(self, installed, sandbox_install_dir):
         if installed:
@@ -921,7 +1048,7 @@ class IndexRequiredFiles(FilesIndex):
 
     max_value = sum(cheese_files.values() + cheese_dirs.values())
 
-    def compute(self, files_list, dirs_list, package_dir):
+    def compute(self, files_list, dirs_list, package_dir, empty_paths=None):
         # Inform user of files and directories the package is missing.
         def make_info(dictionary, what):
             missing = self.get_not_used(dictionary.keys())
@@ -941,13 +1068,15 @@ class IndexRequiredFiles(FilesIndex):
         # Compute required files.
         files_count, files_value = self._compute_from_rules(files_list,
                                                             package_dir,
-                                                            self.cheese_files)
+                                                            self.cheese_files,
+                                                            empty_paths)
         make_info(self.cheese_files, 'file')
 
         # Compute required directories.
         dirs_count, dirs_value = self._compute_from_rules(dirs_list,
                                                           package_dir,
-                                                          self.cheese_dirs)
+                                                          self.cheese_dirs,
+                                                          empty_paths)
         make_info(self.cheese_dirs, 'directory')
 
         self.value = files_value + dirs_value
@@ -1035,16 +1164,20 @@ class IndexUnitTests(Index):
     """
     max_value = 50
 
-    def compute(self, files_list, functions, classes, package_dir):
+    def compute(self, files_list, functions, classes, package_dir, analysis):
         unittest_cnt = 0
-        functions_tested = set()
 
-        # Gather all function names called from test files.
-        for testfile in get_files_of_type(files_list, 'test'):
-            fullpath = os.path.join(package_dir, testfile)
-            code = CodeParser(fullpath, self.cheesecake.log.debug)
+        if analysis is None:
+            analysis = AnalysisCache(self.cheesecake.log.debug)
 
-            functions_tested = functions_tested.union(code.functions_called)
+        # Find functions and classes called from test files.
+        test_files = [os.path.join(package_dir, testfile)
+                      for testfile in get_files_of_type(files_list, 'test')]
+        reached = analysis.call_graph(test_files).reached(test_files,
+                                                          functions + classes)
+        functions_tested = set()
+        for names in reached.itervalues():
+            functions_tested.update(names)
 
         for name in functions + classes:
             if name in functions_tested:
@@ -1123,13 +1256,16 @@ class IndexPyLint(Index):
     """
     name = "pylint"
     max_value = 50
+    concurrency = 'thread'
+    requires_extraction = True
 
     disabled_messages = [
         'W0403',  # relative import
         'W0406',  # importing of self
     ]
 
-    def compute(self, files_list, package_dir, pylint_max_execution_time):
+    def compute(self, files_list, package_dir, pylint_max_execution_time,
+                jobs=1, cache_dir=None, analysis=None):
         # See if pylint script location is set via environment variable
         pylint_location = os.environ.get("PYLINT", "pylint")
 
@@ -1141,32 +1277,80 @@ class IndexPyLint(Index):
         files_to_lint = filter(lambda name: not name.endswith('__init__.py'),
                                get_files_of_type(files_list, 'module'))
 
-        # Switching cwd so that pylint works correctly regarding
-        #     running it on individual modules.
-        original_cwd = os.getcwd()
-
+        # Run pylint from package directory, so that it works correctly
+        #     regarding running it on individual modules. It's given as an
+        #     argument rather than set with os.chdir, since other indices
+        #     may be computed in parallel.
         # Note: package_dir may be a file if the archive contains a single
-        # file. If this is the case, change dir to the parent dir of that file.
+        # file. If this is the case, run it in the parent dir of that file.
         if os.path.isfile(package_dir):
             package_dir = os.path.dirname(package_dir)
 
-        os.chdir(package_dir)
+        if jobs is None:
+            jobs = 1
+
+        cache = None
+        if cache_dir:
+            cache = DiskCache(os.path.join(cache_dir, 'pylint'))
+            # Version output of the very pylint that is going to be run.
+            pylint_version = run_cmd("%s --version" % pylint_location)[1]
+
+        if analysis is None:
+            analysis = AnalysisCache(self.cheesecake.log.debug)
+
+        # Ratings of modules found in cache and cache keys for the rest.
+        cached_ratings = {}
+        cache_keys = {}
+
+        if jobs > 1 or cache is not None:
+            # Run pylint once per module, so that there is something to
+            #     run in parallel and ratings can be cached per module.
+            chunks = []
+            for name in files_to_lint:
+                if cache is not None:
+                    key = self._cache_key(analysis,
+                                          os.path.join(package_dir, name),
+                                          name, pylint_version)
+                    if key is not None:
+                        rating = cache.get(key)
+                        if rating is not None:
+                            self.cheesecake.log.debug(("Using cached pylint "
+                                                       "score for %s.") % name)
+                            cached_ratings[name] = rating
+                            continue
+                        cache_keys[name] = key
+                chunks.append([name])
+        else:
+            chunks = list(generate_arguments(files_to_lint, max_arguments_length - len(self._pylint_args())))
 
-        pylint_score = 0
-        count = 0
-        error_count = 0
+        # All pylint runs share one time budget.
+        deadline = None
+        if pylint_max_execution_time:
+            deadline = time.time() + pylint_max_execution_time
 
-        for filenames in generate_arguments(files_to_lint, max_arguments_length - len(self._pylint_args())):
+        def run_pylint(filenames):
             filenames = ' '.join(filenames)
+
+            max_timeout = None
+            if deadline is not None:
+                max_timeout = deadline - time.time()
+                if max_timeout <= 0:
+                    return 1, "Time exceeded"
+
             self.cheesecake.log.debug(("Running pylint on "
                                        "files: %s.") % filenames)
+            return run_cmd("%s %s --persistent=n --reports=y %s" %
+                           (pylint_location,
+                            filenames,
+                            self._pylint_args()),
+                           max_timeout=max_timeout,
+                           cwd=package_dir)
+
+        ratings = {}
+        error_count = 0
 
-            # Run pylint, but don't allow it to work longer than one minute.
-            rc, output = run_cmd("%s %s --persistent=n %s" %
-                                 (pylint_location,
-                                  filenames,
-                                  self._pylint_args()),
-                                 max_timeout=pylint_max_execution_time)
+        for chunk, (rc, output) in zip(chunks,
+                                       thread_map(run_pylint, chunks, jobs)):
             if rc & 1 or rc >= 32:
                 if output == 'Time exceeded':
                     # Raise and exception what will cause PyLint to be removed
@@ -1181,18 +1365,44 @@ class IndexPyLint(Index):
                                           (rc, output))
                 error_count += 1
             else:
-                # Extract score from pylint output.
+                # Extract score and number of statements from pylint
+                #     output. If the latter is missing, each module counts
+                #     as one.
                 s = re.search(r"Your code has been rated at (-?\d+\.\d+)/10",
                               output)
                 if s:
-                    pylint_score += float(s.group(1))
-                    count += 1
+                    statements = re.search(r"(\d+) statements analysed",
+                                           output)
+                    if statements:
+                        statements = int(statements.group(1))
+                    else:
+                        statements = len(chunk)
+                    ratings[chunk[0]] = (float(s.group(1)), statements)
+                    if chunk[0] in cache_keys:
+                        cache.set(cache_keys[chunk[0]], ratings[chunk[0]])
 
-        # Switching back to the original cwd.
-        os.chdir(original_cwd)
+        ratings.update(cached_ratings)
+
+        # Weight ratings by number of statements, the way pylint does for
+        #     modules checked together, so that the score doesn't depend on
+        #     whether modules were checked one by one. Add them up in files
+        #     order, so that the sum doesn't depend on which were cached.
+        pylint_score = 0
+        count = 0
+        total_statements = 0
+        for name in files_to_lint:
+            if name in ratings:
+                rating, statements = ratings[name]
+                pylint_score += rating * statements
+                total_statements += statements
+                count += 1
 
         if count:
-            pylint_score = float(pylint_score)/float(count)
+            if total_statements:
+                pylint_score = float(pylint_score)/float(total_statements)
+            else:
+                # Only modules without statements, which rate the same.
+                pylint_score = ratings.values()[0][0]
             self.details = "pylint score was %.2f out of 10" % pylint_score
         elif error_count:
             self.details = "encountered an error during pylint execution"
@@ -1238,6 +1448,20 @@ class IndexPyLint(Index):
             # pylint is not installed
             return ""
 
+    @classmethod
+    def _cache_key(cls, analysis, path, filename, pylint_version):
+        """Return key of (rating, statements) pair of module at `path`.
+
+        Module name matters to pylint, so it is a part of the key, along
+        with module contents, pylint version and its arguments.
+        """
+        try:
+            source = analysis.source_file(path).source
+        except IOError:
+            return None
+        return hash_key('statements', filename, source, pylint_version,
+                        cls._pylint_args())
+
 
 class IndexPEP8(Index):
     """Compute PEP8 index for the modules in the package.
@@ -1268,21 +1492,33 @@ class IndexPEP8(Index):
     error_score = -2
     warning_score = -1
 
-    def compute(self, files_list, package_dir):
+    # Checking is CPU-bound, so threads wouldn't help.
+    concurrency = 'process'
+
+    def compute(self, files_list, package_dir, analysis, jobs=1):
         files_to_score = get_files_of_type(files_list, 'module')
         if len(files_to_score) == 0:
             self.value = 0
             self.details = "no modules found"
             return self.value
 
+        report = pep8.Report(pep8.parse_options(["-qq"]))
         full_paths = [os.path.join(package_dir, file) for file in files_to_score]
-        arglist = ["-qq"] + full_paths
-        pep8.process_options(arglist)
-        for file in files_to_score:
-            fullpath = os.path.join(package_dir, file)
-            pep8.input_file(fullpath)
-        error_stats = pep8.get_error_statistics()
-        warning_stats = pep8.get_warning_statistics()
+
+        if jobs > 1 and not (analysis and analysis.sources):
+            # Worker processes read and tokenize files on their own, which
+            #     is cheaper than sending them tokens from analysis. That
+            #     isn't possible when sources are only in memory.
+            report.input_files(full_paths, jobs)
+        else:
+            if analysis is None:
+                analysis = AnalysisCache(self.cheesecake.log.debug)
+
+            for fullpath in full_paths:
+                source = analysis.source_file(fullpath)
+                report.input_file(fullpath, source.lines, source.tokens)
+        error_stats = report.get_error_statistics()
+        warning_stats = report.get_warning_statistics()
 
         errors = len(error_stats)
         warnings = len(warning_stats)
@@ -1402,6 +1638,29 @@ class Cheesecake(object):
 
     steps = {}
 
+    # Directory for caches persistent between runs (None disables them).
+    cache_dir = None
+    # Maximum size of package files kept in the cache, in bytes.
+    cache_size = 500 * 1024 * 1024
+    # URL of package index to download packages from (None means PyPI).
+    index_url = None
+    # Limits for test installation of the package: maximum time in seconds
+    # and maximum memory in bytes (None means no limit).
+    install_max_execution_time = 300
+    install_max_memory = None
+    # InstallRootPool to take install directory from (None means sandbox).
+    install_pool = None
+    # Number of processes used for parsing and computing indices.
+    jobs = 1
+    # Contents of package archive, when it was read instead of extracted.
+    package_contents = None
+    # Time in seconds all pylint runs can take together (None means no
+    # limit).
+    pylint_max_execution_time = 120
+    # Time in seconds package downloaded by a name without exact version
+    # is taken from cache, before PyPI is asked for a newer one.
+    pypi_cache_max_age = 24 * 60 * 60
+
     package_types = {
         "tar.gz": untar_package,
         "tgz": untar_package,
@@ -1409,13 +1668,27 @@ class Cheesecake(object):
         "egg": unegg_package,
     }
 
+    package_readers = {
+        "tar.gz": read_tar_package,
+        "tgz": read_tar_package,
+        "zip": read_zip_package,
+        "egg": read_egg_package,
+    }
+
     def __init__(self,
+                 cache_dir=None,
+                 cache_size=None,
+                 index_url=None,
+                 install_max_execution_time=300,
+                 install_max_memory=None,
+                 install_pool=None,
+                 jobs=1,
                  keep_log=False,
                  lite=False,
                  logfile=None,
                  name="",
                  path="",
-                 pylint_max_execution_time=None,
+                 pylint_max_execution_time=120,
                  quiet=False,
                  sandbox=None,
                  static_only=False,
@@ -1444,6 +1717,14 @@ class Cheesecake(object):
         if not os.path.isdir(self.sandbox):
             os.mkdir(self.sandbox)
 
+        self.cache_dir = cache_dir
+        if cache_size is not None:
+            self.cache_size = cache_size
+        self.index_url = index_url
+        self.install_max_execution_time = install_max_execution_time
+        self.install_max_memory = install_max_memory
+        self.install_pool = install_pool
+        self.jobs = jobs
         self.verbose = verbose
         self.quiet = quiet
         self.static_only = static_only
@@ -1498,6 +1779,15 @@ class Cheesecake(object):
         # Install package.
         self.run_step('install_pkg')
 
+    def __getstate__(self):
+        """Leave out resources bound to the current process, so that scored
+        Cheesecake (and indices referring to it) can be sent to another one.
+        """
+        state = self.__dict__.copy()
+        for name in ['install_pool', 'logfile_descriptor']:
+            state.pop(name, None)
+        return state
+
     def raise_exception(self, msg):
         """Cleanup, print error message and raise CheesecakeError.
 
@@ -1506,6 +1796,10 @@ class Cheesecake(object):
         """
         self.cleanup(remove_log_file=False)
 
+        # Nothing will be logged after this point. Close the descriptor, so
+        # that batch runs don't leak one for every failed package.
+        self.logfile_descriptor.close()
+
         msg += "\nDetailed info available in log file %s" % self.logfile
 
         raise CheesecakeError("Error: " + msg)
@@ -1526,6 +1820,10 @@ class Cheesecake(object):
 
         delete_dir(self.sandbox)
 
+        # Install directory outside of sandbox is reused by other packages.
+        if self.install_pool is not None:
+            self.install_pool.checkin(self.sandbox_install_dir)
+
         if remove_log_file and not self.keep_log:
             # Close the log file descriptor before removing
             # (Linux doesn't care, but it matters on Windows).
@@ -1559,6 +1857,15 @@ class Cheesecake(object):
         self.log.warn = logger.MultipleProducer('cheesecake console')
         self.log.error = logger.MultipleProducer('cheesecake console')
 
+    def get_artifact_cache(self):
+        """Return cache of downloaded packages, or None if caching is
+        disabled.
+        """
+        if not self.cache_dir:
+            return None
+        return ArtifactCache(os.path.join(self.cache_dir, 'packages'),
+                             self.cache_size)
+
     def run_step(self, step_name):
         """Run step if its decide() method returns True.
         """
@@ -1587,12 +1894,30 @@ class Cheesecake(object):
           found_locally : bool
               Whenever package has been already installed.
         """
+        # Package downloaded before doesn't need to be fetched again. Unless
+        #     its version is pinned, new one may be released in the meantime.
+        cache = self.get_artifact_cache()
+        cache_key = hash_key('pypi', self.index_url or '', self.name)
+        if is_pinned_requirement(self.name):
+            max_age = None
+        else:
+            max_age = self.pypi_cache_max_age
+        if cache is not None:
+            cached = cache.get(cache_key, self.sandbox, max_age)
+            if cached is not None:
+                self.sandbox_pkg_file, metadata = cached
+                for name, value in metadata.iteritems():
+                    setattr(self, name, value)
+                self.package = get_package_name_from_path(self.sandbox_pkg_file)
+                self.log.info("Using cached package %s downloaded from %s" %
+                              (self.package, self.download_url))
+                return
+
         self.log.info(("Trying to download package %s from PyPI using "
                        "setuptools utilities") % self.name)
 
         try:
-            from setuptools.package_index import PackageIndex
-            from pkg_resources import Requirement
+            from pkg_resources import Environment, Requirement
             from distutils import log
             from distutils.errors import DistutilsError
         except ImportError, e:
@@ -1625,26 +1950,34 @@ class Cheesecake(object):
 
             Returns tuple (status, output), where `status` is True
             if fetch was successful and False if it failed. `output`
-            is PackageIndex.fetch() return value.
+            is location of fetched package or None if it wasn't found.
+
+            All modes share one package index, so its pages are read
+            only once.
             """
-            if 'pypi' in mode:
-                pkgindex = PackageIndex(search_path=[])
-            else:
-                pkgindex = PackageIndex()
+            pkgindex = get_package_index(self.index_url)
 
             if mode == 'pypi_source':
                 source = True
             else:
                 source = False
 
+            if mode == 'any':
+                local_index = Environment()
+            else:
+                local_index = None
+
             try:
-                output = pkgindex.fetch(Requirement.parse(self.name),
-                                        self.sandbox,
-                                        force_scan=True,
-                                        source=source)
-                return True, output
+                dist = pkgindex.fetch_distribution(Requirement.parse(self.name),
+                                                   self.sandbox,
+                                                   force_scan=True,
+                                                   source=source,
+                                                   local_index=local_index)
             except DistutilsError, e:
                 return False, e
+            if dist is None:
+                return True, None
+            return True, dist.location
 
         # Temporarily set the log verbosity to INFO so we can capture
         # setuptools info messages.
@@ -1710,36 +2043,91 @@ class Cheesecake(object):
         if "cheeseshop.python.org" in self.download_url:
             self.found_on_cheeseshop = True
 
+        # Locally installed packages are directories, which aren't cached.
+        if cache is not None and not self.found_locally:
+            cache.put(cache_key, self.sandbox_pkg_file,
+                      {'download_url': self.download_url,
+                       'distance_from_pypi': self.distance_from_pypi,
+                       'found_on_cheeseshop': self.found_on_cheeseshop,
+                       'found_locally': self.found_locally})
+
     steps['download_pkg'] = StepByVariable('url',
                                            ['sandbox_pkg_file',
                                             'downloaded_from_url'])
 
     def download_pkg(self):
-        """Use ``urllib.urlretrieve`` to download package to file in sandbox
-           dir.
+        """Download package from URL to file in sandbox dir.
+
+        Package kept in cache is downloaded again only if server says it
+        has changed since.
         """
         #self.log("Downloading package %s from URL %s" %
         #         (self.package, self.url))
         self.sandbox_pkg_file = os.path.join(self.sandbox, self.package)
+
+        cache = self.get_artifact_cache()
+        cache_key = hash_key('url', self.url)
+        cached = None
+        if cache is not None:
+            cached = cache.get(cache_key, self.sandbox)
+
+        if cached is not None:
+            self.sandbox_pkg_file, request_headers = cached
+            if not request_headers:
+                # Server gave no way to check whether package has changed.
+                self.log.info("Using cached package %s downloaded from %s" %
+                              (self.package, self.url))
+                self.downloaded_from_url = True
+                return
+            # Cached file may be linked with the cache, so new version
+            # mustn't be written over it.
+            filename = self.sandbox_pkg_file + '.download'
+        else:
+            request_headers = None
+            filename = self.sandbox_pkg_file
+
         try:
-            downloaded_filename, headers = urlretrieve(self.url,
-                                                       self.sandbox_pkg_file)
+            downloaded_filename, headers = urlretrieve(self.url, filename,
+                                                       request_headers)
+        except HTTPError, e:
+            self.raise_exception("Got '%d %s' error while trying "
+                                 "to download package ... exiting" %
+                                 (e.code, e.msg))
         except IOError, e:
+            if cached is not None:
+                self.log.info("Could not check whether package %s has "
+                              "changed (%s), using cached one" %
+                              (self.package, e))
+                self.downloaded_from_url = True
+                return
             self.log.error("Error downloading package %s from URL %s" %
                            (self.package, self.url))
             self.raise_exception(str(e))
         #self.log("Downloaded package %s to %s" % (self.package,
         #                                          downloaded_filename))
 
+        self.downloaded_from_url = True
+
+        if downloaded_filename is None:
+            self.log.info("Package %s at %s not modified, using cached one" %
+                          (self.package, self.url))
+            return
+
+        if cached is not None:
+            os.rename(downloaded_filename, self.sandbox_pkg_file)
+
+        # Some servers report missing files with a regular HTML page.
         if headers.gettype() in ["text/html"]:
-            f = open(downloaded_filename)
-            if re.search("404 Not Found", "".join(f.readlines())):
-                f.close()
+            f = open(self.sandbox_pkg_file)
+            page_start = f.read(COPY_CHUNK_SIZE)
+            f.close()
+            if re.search("404 Not Found", page_start):
                 self.raise_exception("Got '404 Not Found' error while trying "
                                      "to download package ... exiting")
-            f.close()
 
-        self.downloaded_from_url = True
+        if cache is not None:
+            cache.put(cache_key, self.sandbox_pkg_file,
+                      conditional_headers(headers))
 
     steps['copy_pkg'] = StepByVariable('package_path',
                                        ['sandbox_pkg_file'])
@@ -1756,6 +2144,7 @@ class Cheesecake(object):
         shutil.copyfile(self.package_path, self.sandbox_pkg_file)
 
     steps['unpack_pkg'] = Step(['original_package_name',
+                                'package_contents',
                                 'sandbox_pkg_dir',
                                 'unpacked',
                                 'unpack_dir'])
@@ -1766,19 +2155,45 @@ class Cheesecake(object):
         Check `package_types` attribute for list of currently supported
         archive types.
 
+        If no index needs package files on disk, the archive is only read
+        and its contents are kept in memory.
+
         New attributes:
           original_package_name : str
               Package name guessed from the package name. Will be set only
               if package name is different than unpacked directory name.
+          package_contents : PackageContents
+              Contents of the package archive. Will be set only if the
+              package wasn't extracted.
         """
         self.sandbox_pkg_dir = os.path.join(self.sandbox, self.package_name)
         if os.path.isdir(self.sandbox_pkg_dir):
             self.log("Directory %s exist - removing..." % self.sandbox_pkg_dir)
             rmtree(self.sandbox_pkg_dir)
 
-        # Call appropriate function to unpack the package.
-        unpack = self.package_types[self.package_type]
-        self.unpack_dir = unpack(self.sandbox_pkg_file, self.sandbox)
+        if self.index.requires_extraction or \
+               not os.path.isfile(self.sandbox_pkg_file):
+            skip = None
+            if not self.index.requires_all_files:
+                # Other files only need their names and sizes.
+                skip = lambda name, size: not has_extension(name, '.py')
+
+            # Call appropriate function to unpack the package.
+            unpack = self.package_types[self.package_type]
+            stats = {'written': 0, 'skipped': 0}
+            self.unpack_dir = unpack(self.sandbox_pkg_file, self.sandbox,
+                                     skip, stats)
+            self.log.debug("Extracted %(written)d bytes, skipped "
+                           "%(skipped)d bytes." % stats)
+        else:
+            self.log.debug("Reading package %s without extracting it." %
+                           self.sandbox_pkg_file)
+            read = self.package_readers[self.package_type]
+            self.package_contents = read(self.sandbox_pkg_file)
+            if self.package_contents is None:
+                self.unpack_dir = None
+            else:
+                self.unpack_dir = self.package_contents.unpack_dir
 
         if self.unpack_dir is None:
             self.raise_exception("Could not unpack package %s ... exiting" %
@@ -1790,10 +2205,12 @@ class Cheesecake(object):
             self.original_package_name = self.package_name
             self.package_name = self.unpack_dir
 
-    steps['walk_pkg'] = Step(['dirs_list',
+    steps['walk_pkg'] = Step(['analysis',
+                              'dirs_list',
                               'docstring_cnt',
                               'docformat_cnt',
                               'doctests_count',
+                              'empty_paths',
                               'unittests_count',
                               'files_list',
                               'functions',
@@ -1806,6 +2223,8 @@ class Cheesecake(object):
         """Get package files and directories.
 
         New attributes:
+          analysis : AnalysisCache
+              Parsed source files, shared by all indices.
           dirs_list : list
               List of directories package contains.
           docstring_cnt : int
@@ -1814,6 +2233,10 @@ class Cheesecake(object):
               Number of formatted docstrings found in all package objects.
           doctests_count : int
               Number of docstrings that include doctests.
+          empty_paths : set
+              Empty files and directories from files_list and dirs_list.
+              Will be None if the package was extracted, in which case
+              the file system should be checked.
           unittests_count : int
               Number of classes which inherit from unittest.TestCase.
           files_list : list
@@ -1831,7 +2254,24 @@ class Cheesecake(object):
         """
         self.package_dir = os.path.join(self.sandbox, self.package_name)
 
-        self.files_list, self.dirs_list = get_files_dirs_list(self.package_dir)
+        if self.package_contents is None:
+            self.files_list, self.dirs_list = \
+                get_files_dirs_list(self.package_dir)
+            self.empty_paths = None
+            sources = None
+        else:
+            # Python sources are in memory, but are keyed by paths they
+            #     would have after extraction.
+            (self.files_list, self.dirs_list, self.empty_paths,
+             relative_sources) = self.package_contents.listing()
+            sources = {}
+            for name, source in relative_sources.iteritems():
+                sources[os.path.join(self.package_dir, name)] = source
+
+        parser_cache = None
+        if self.cache_dir:
+            parser_cache = DiskCache(os.path.join(self.cache_dir, 'codeparser'))
+        self.analysis = AnalysisCache(self.log.debug, parser_cache, sources)
 
         self.object_cnt = 0
         self.docstring_cnt = 0
@@ -1844,9 +2284,12 @@ class Cheesecake(object):
 
         # Parse all application files and count objects
         # (modules/classes/functions) and their associated docstrings.
-        for py_file in get_files_of_type(self.files_list, 'module'):
-            pyfile = os.path.join(self.package_dir, py_file)
-            code = CodeParser(pyfile, self.log.debug)
+        py_files = map(lambda x: os.path.join(self.package_dir, x),
+                       get_files_of_type(self.files_list, 'module'))
+        self.analysis.parse(py_files, self.jobs)
+
+        for pyfile in py_files:
+            code = self.analysis.source_file(pyfile).code
 
             self.object_cnt += code.object_count()
             self.docstring_cnt += code.docstring_count()
@@ -1868,6 +2311,9 @@ class Cheesecake(object):
     def install_pkg(self):
         """Verify that package can be installed in alternate directory.
 
+        Result of successfully installing identical package file is taken
+        from cache.
+
         New attributes:
           installed : bool
               Describes whenever package has been succefully installed.
@@ -1878,6 +2324,70 @@ class Cheesecake(object):
                                                 ("tmp_install_%s" %
                                                  self.package_name))
 
+        cache = None
+        if self.cache_dir and os.path.isfile(self.sandbox_pkg_file):
+            cache = DiskCache(os.path.join(self.cache_dir, 'install'))
+            # Key on the Python which runs the installation, not the one
+            # running Cheesecake.
+            # Limits are part of the key too, since installation which ran
+            # out of time or memory could succeed with higher ones.
+            cache_key = hash_key(hash_file(self.sandbox_pkg_file),
+                                 self.package_type,
+                                 get_installer_version(self.get_installer()),
+                                 str(self.install_max_execution_time),
+                                 str(self.install_max_memory))
+            result = cache.get(cache_key)
+        else:
+            result = None
+
+        if result is None:
+            result = self.run_install()
+            # Failed installation may succeed next time (it could have
+            # failed to download a dependency, for example).
+            if cache is not None and result[0] == 0:
+                cache.set(cache_key, result)
+        else:
+            self.log.info("Using cached result of installing package %s" %
+                          self.package)
+
+        rc, output = result
+        if rc:
+            self.log('*** Installation failed. Captured output:')
+            # Stringify output as it may be an exception.
+            for output_line in str(output).splitlines():
+                self.log(output_line)
+            self.log('*** End of captured output.')
+        else:
+            self.log('Installation into %s successful.' %
+                     self.sandbox_install_dir)
+            self.installed = True
+
+    def get_installer(self):
+        """Return name of command used to install the package.
+        """
+        if self.package_type == 'egg':
+            return 'easy_install'
+        return 'python'
+
+    def run_install(self):
+        """Install package into `sandbox_install_dir`, or into directory
+        taken from `install_pool` if there is one.
+
+        Installation is stopped after `install_max_execution_time` seconds.
+        Both that time (as CPU time) and `install_max_memory` are also
+        enforced as resource limits of the install process.
+
+        Return (rc, output) tuple.
+        """
+        if self.install_pool is not None:
+            self.sandbox_install_dir = self.install_pool.checkout()
+
+        limits = {}
+        if self.install_max_execution_time:
+            limits['CPU'] = int(ceil(self.install_max_execution_time))
+        if self.install_max_memory:
+            limits['AS'] = self.install_max_memory
+
         if self.package_type == 'egg':
             # Create dummy Python directories.
             mkdirs('%s/lib/python2.3/site-packages/' %
@@ -1891,30 +2401,25 @@ class Cheesecake(object):
                            {'sandbox': self.sandbox_install_dir},
                            # Pass PATH to child process.
                            'PATH': os.getenv('PATH')}
-            rc, output = run_cmd("easy_install --no-deps --prefix %s %s" %
-                                 (self.sandbox_install_dir,
+            rc, output = run_cmd("%s --no-deps --prefix %s %s" %
+                                 (self.get_installer(),
+                                  self.sandbox_install_dir,
                                   self.sandbox_pkg_file),
-                                 environment)
+                                 environment,
+                                 max_timeout=self.install_max_execution_time,
+                                 limits=limits)
         else:
             package_dir = os.path.join(self.sandbox, self.package_name)
             if not os.path.isdir(package_dir):
                 package_dir = self.sandbox
-            cwd = os.getcwd()
-            os.chdir(package_dir)
-            rc, output = run_cmd("python setup.py install --root=%s" %
-                                 self.sandbox_install_dir)
-            os.chdir(cwd)
+            rc, output = run_cmd("%s setup.py install --root=%s" %
+                                 (self.get_installer(),
+                                  self.sandbox_install_dir),
+                                 max_timeout=self.install_max_execution_time,
+                                 cwd=package_dir,
+                                 limits=limits)
 
-        if rc:
-            self.log('*** Installation failed. Captured output:')
-            # Stringify output as it may be an exception.
-            for output_line in str(output).splitlines():
-                self.log(output_line)
-            self.log('*** End of captured output.')
-        else:
-            self.log('Installation into %s successful.' %
-                     self.sandbox_install_dir)
-            self.installed = True
+        return rc, str(output)
 
     def compute_cheesecake_index(self):
         """Compute overall Cheesecake index for the package by adding up
@@ -1953,6 +2458,162 @@ class Cheesecake(object):
         return cheesecake_index
 
 
+###############################################################################
+## Batch scoring.
+###############################################################################
+
+def score_package(**options):
+    """Compute Cheesecake index for one package without leaving the current
+    process.
+
+    All `options` are passed to the `Cheesecake` constructor, so package is
+    given by one of `name`, `url` or `path`. Unless told otherwise, nothing is
+    printed to stdout. Sandbox and log file are cleaned up afterwards.
+
+    Return computed `CheesecakeIndex` instance. Its `value` and `max_value`
+    give overall score and each subindex keeps its own value and details.
+    Raise `CheesecakeError` if package couldn't be scored.
+    """
+    options.setdefault('quiet', True)
+
+    cheesecake = Cheesecake(**options)
+    try:
+        cheesecake.index.compute_with(cheesecake)
+    finally:
+        cheesecake.cleanup()
+
+    return cheesecake.index
+
+
+def score_packages(packages, package_jobs=1, **options):
+    """Score many packages, one after another or `package_jobs` at a time.
+
+    Each element of `packages` is a dictionary with `Cheesecake` constructor
+    arguments specific for that package (like `name` or `path`), while
+    `options` are shared by all of them.
+
+    Unless `install_pool` is given, packages are installed into directories
+    of a pool shared by the whole batch.
+
+    With `package_jobs` greater than 1, each package is scored in its own
+    process, so that installation of one package doesn't hold up parsing
+    and pylint of the others. Results then come in order in which packages
+    were scored, so that one slow package doesn't hold up the others.
+
+    Yield (package, index, error) tuples, where `index` is a `CheesecakeIndex`
+    instance or None if scoring failed with `error`. Unexpected errors are
+    logged and reported as `CheesecakeError` with their traceback, so that
+    they don't stop the batch.
+    """
+    own_install_pool = options.get('install_pool') is None
+    if own_install_pool:
+        options['install_pool'] = InstallRootPool()
+    install_pool = options['install_pool']
+
+    def score(package, install_pool):
+        package_options = options.copy()
+        package_options.update(package)
+        package_options['install_pool'] = install_pool
+
+        try:
+            return score_package(**package_options), None
+        except CheesecakeError, e:
+            return None, e
+        except Exception:
+            return None, unexpected_error(package, traceback.format_exc())
+
+    def unexpected_error(package, message):
+        log.error("Scoring of %s failed unexpectedly:\n%s" %
+                  (package, message))
+        return CheesecakeError(message)
+
+    log = logger.MultipleProducer('cheesecake console')
+
+    # Maps ProcessCall scoring a package to (package, slot) pair.
+    pending = {}
+    try:
+        if package_jobs <= 1:
+            for package in packages:
+                index, error = score(package, install_pool)
+                yield package, index, error
+            return
+
+        # Processes scoring packages at the same time mustn't share install
+        # directories, so each of them gets a separate part of the pool.
+        free_slots = [InstallRootPool(os.path.join(install_pool.directory,
+                                                   'slot%d' % i))
+                      for i in range(package_jobs)]
+
+        def finish_first():
+            call = first_finished(pending.keys())
+            package, slot = pending.pop(call)
+            free_slots.append(slot)
+            try:
+                index, error = call.result()
+            except ProcessCallError, e:
+                index, error = None, unexpected_error(package, str(e))
+            return package, index, error
+
+        for package in packages:
+            if not free_slots:
+                yield finish_first()
+
+            slot = free_slots.pop()
+            call = ProcessCall(lambda package=package, slot=slot:
+                               score(package, slot))
+            pending[call] = (package, slot)
+
+        while pending:
+            yield finish_first()
+    finally:
+        # Don't leave processes behind if caller stopped early.
+        for call in pending:
+            try:
+                call.result()
+            except ProcessCallError:
+                pass
+        if own_install_pool:
+            install_pool.close()
+
+
+def index_values(index):
+    """Return dictionary mapping names of index and all its subindices to
+    their values, named the way Cheesecake script prints them.
+
+    >>> class IndexOne(Index):
+    ...     value = 1
+    ...     max_value = 2
+    >>> class IndexTwo(Index):
+    ...     value = 2
+    ...     max_value = 2
+    >>> index = Index(IndexOne(), IndexTwo())
+    >>> index.value = 3
+    >>> values = index_values(index)
+    >>> values == {'one': 1, 'two': 2, 'unnamed INDEX (ABSOLUTE)': 3,
+    ...            'unnamed INDEX (RELATIVE)': 75}
+    True
+    """
+    if not index.subindices:
+        return {index_class_to_name(index.name): index.value}
+
+    values = {}
+    max_value = index.max_value
+    if max_value == 0:
+        # Such indices aren't printed.
+        pass
+    elif isinstance(index, CheesecakeIndex):
+        values["OVERALL CHEESECAKE INDEX (ABSOLUTE)"] = index.value
+        values["OVERALL CHEESECAKE INDEX (RELATIVE)"] = \
+            (index.value * 100) / max_value
+    else:
+        values["%s INDEX (ABSOLUTE)" % index.name] = index.value
+        values["%s INDEX (RELATIVE)" % index.name] = \
+            int(ceil(float(index.value) / float(max_value) * 100))
+    for subindex in index.subindices:
+        values.update(index_values(subindex))
+    return values
+
+
 ###############################################################################
 ## Command line.
 ###############################################################################
@@ -2009,6 +2670,31 @@ def process_cmdline_args():
                         help="check pep8 conformance")
 
     # Other arguments.
+    parser.add_argument("--cache-dir",
+                        dest="cache_dir",
+                        default=None,
+                        help=("directory for caches kept between runs, "
+                              "like parsing results of unchanged modules "
+                              "(default is not to cache anything)"))
+    parser.add_argument("--cache-size",
+                        dest="cache_size",
+                        type=int,
+                        default=500,
+                        help=("maximum size in megabytes of downloaded "
+                              "packages kept in cache directory "
+                              "(default=500)"))
+    parser.add_argument("-i", "--index-url",
+                        dest="index_url",
+                        default=None,
+                        help=("URL of package index used to download "
+                              "packages by name (default is PyPI)"))
+    parser.add_argument("-j", "--jobs",
+                        dest="jobs",
+                        type=int,
+                        default=1,
+                        help=("number of processes used for parsing "
+                              "package modules, computing indices and "
+                              "running pylint (default=1)"))
     parser.add_argument("-l", "--logfile",
                         dest="logfile",
                         default=None,
@@ -2030,8 +2716,21 @@ def process_cmdline_args():
                         action="store",
                         dest="pylint_max_execution_time",
                         default=120,
-                        help=("maximum time (in seconds) you allow pylint "
-                              "process to run (default=120)"))
+                        help=("maximum time (in seconds) you allow all "
+                              "pylint processes to run (default=120)"))
+    parser.add_argument("--install-max-execution-time",
+                        dest="install_max_execution_time",
+                        type=int,
+                        default=300,
+                        help=("maximum time (in seconds) you allow "
+                              "package installation to run (default=300)"))
+    parser.add_argument("--install-max-memory",
+                        dest="install_max_memory",
+                        type=int,
+                        default=None,
+                        help=("maximum memory (in megabytes) you allow "
+                              "package installation to use (default is "
+                              "no limit)"))
 
     parser.add_argument("-V", "--version",
                         action="store_true",
@@ -2048,6 +2747,14 @@ def main():
        arguments.
     """
     arguments = process_cmdline_args()
+    cache_dir = arguments.cache_dir
+    cache_size = arguments.cache_size * 1024 * 1024
+    index_url = arguments.index_url
+    install_max_execution_time = arguments.install_max_execution_time
+    install_max_memory = arguments.install_max_memory
+    if install_max_memory:
+        install_max_memory *= 1024 * 1024
+    jobs = arguments.jobs
     keep_log = arguments.keep_log
     lite = arguments.lite
     logfile = arguments.logfile
@@ -2071,7 +2778,13 @@ def main():
         sys.exit(1)
 
     try:
-        c = Cheesecake(keep_log=keep_log,
+        c = Cheesecake(cache_dir=cache_dir,
+                       cache_size=cache_size,
+                       index_url=index_url,
+                       install_max_execution_time=install_max_execution_time,
+                       install_max_memory=install_max_memory,
+                       jobs=jobs,
+                       keep_log=keep_log,
                        lite=lite,
                        logfile=logfile,
                        name=name,
@@ -93,17 +93,100 @@ supported_formats = {
 }
 
 
+def embeddable_pattern(regex):
+    """Return pattern of compiled `regex` which can be embedded in a bigger
+    verbose regular expression.
+
+    Groups are made non-capturing, as Python limits number of groups in
+    a single expression. Whitespace and comment characters of non-verbose
+    patterns are escaped.
+
+    >>> print embeddable_pattern(re.compile(r'(a|b) [c ]#'))
+    (?:a|b)\ [c ]\#
+    >>> print embeddable_pattern(re.compile(r'(?:a)  (b)', re.VERBOSE))
+    (?:a)  (?:b)
+    """
+    verbose = regex.flags & re.VERBOSE
+    pattern = regex.pattern
+
+    result = []
+    escaped = in_set = False
+    for i, char in enumerate(pattern):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif in_set:
+            if char == ']':
+                in_set = False
+        elif char == '[':
+            in_set = True
+        elif char == '(' and pattern[i+1:i+2] != '?':
+            char = '(?:'
+        elif not verbose and (char.isspace() or char == '#'):
+            result.append('\\')
+        result.append(char)
+    return ''.join(result)
+
+
+# Combined regular expressions for sets of formats, see find_formats.
+format_matchers = {}
+
+def get_format_matcher(formats):
+    """Return regular expression matching any pattern of given `formats`,
+    with a named group for each format.
+    """
+    key = tuple(sorted(formats))
+    if key not in format_matchers:
+        alternatives = []
+        for format in key:
+            patterns = map(embeddable_pattern, supported_formats[format])
+            alternatives.append('(?P<%s>(?:%s))' % (format,
+                                                    ')|(?:'.join(patterns)))
+        format_matchers[key] = re.compile('|'.join(alternatives),
+                                          re.LOCALE | re.VERBOSE)
+    return format_matchers[key]
+
+
+def find_formats(text, formats=None):
+    """Return set of documentation formats (from `formats`, all supported
+    formats by default) used in text.
+
+    Patterns of all formats are tried together in a single scan. After a
+    match only formats not found yet are looked for, starting at the same
+    position, so the result is the same as of searching for each pattern
+    separately.
+
+    >>> sorted(find_formats("Use *emphasis*.\\n\\n@param x: value"))
+    ['epytext', 'javadoc', 'reST']
+    >>> find_formats("Plain text.")
+    set([])
+    """
+    if formats is None:
+        formats = supported_formats.keys()
+    remaining = set(formats)
+    found = set()
+    position = 0
+    while remaining:
+        match = get_format_matcher(remaining).search(text, position)
+        if match is None:
+            break
+        for format in remaining:
+            if match.group(format) is not None:
+                break
+        found.add(format)
+        remaining.remove(format)
+        position = match.start()
+    return found
+
+
 def use_format(text, format):
     """Return True if text includes given documentation format
     and False otherwise.
 
     See supported_formats for list of known formats.
     """
-    for pattern in supported_formats[format]:
-        if re.search(pattern, text):
-            return True
-
-    return False
+    return format in find_formats(text, [format])
 
 
 class CodeParser(object):
@@ -112,7 +195,21 @@ class CodeParser(object):
     * Collects modules, classes, methods, functions and associated docstrings
     * Based on mwh's docextractor.model module
     """
-    def __init__(self, pyfile, log=None):
+    # Attributes holding results of parsing, see summary().
+    summary_attributes = ['modules',
+                          'classes',
+                          'methods',
+                          'method_func',
+                          'functions',
+                          'docstrings',
+                          'docstrings_by_format',
+                          'formatted_docstrings_count',
+                          'doctests_count',
+                          'imported_references',
+                          'references',
+                          'unittests_count']
+
+    def __init__(self, pyfile, log=None, ast=None):
         """Initialize Code Parser object.
 
         :Parameters:
@@ -120,6 +217,8 @@ class CodeParser(object):
               Path to a Python module to parse.
           `log` : logger.Producer instance
               Logger to use during code parsing.
+          `ast` : ast.Module instance
+              Already parsed module. If not given, `pyfile` will be parsed.
         """
         if log:
             self.log = log.codeparser
@@ -131,6 +230,8 @@ class CodeParser(object):
         self.method_func = []
         self.functions = []
         self.docstrings = []  # objects that have docstrings
+        self.references = []  # called names, also resolved through imports
+        self.imported_references = []  # those which imports resolved
         self.docstrings_by_format = {}
         self.formatted_docstrings_count = 0
         self.doctests_count = 0
@@ -145,12 +246,17 @@ class CodeParser(object):
         self.log("Inspecting file: " + pyfile)
 
         self.system = System()
+        self.func_called = self.system.func_called
         try:
-            processModuleAst(parseFile(pyfile), module, self.system)
+            if ast is None:
+                ast = parseFile(pyfile)
+            processModuleAst(ast, module, self.system)
         except Exception, e:
             self.log("Code parsing error occured:\n***\n%s\n***" % str(e))
             return
 
+        references = {}
+        imported_references = {}
         for obj in self.system.orderedallobjects:
             fullname = obj.fullName()
             if isinstance(obj, Module):
@@ -160,16 +266,29 @@ class CodeParser(object):
                     self.unittests_count += 1
                 self.classes.append(fullname)
             if isinstance(obj, Function):
+                # Called names as written and resolved in the function's
+                # scope, so that after "from mod import f", a call to f()
+                # refers to "mod.f" as well.
+                for name in obj.calls:
+                    resolved = obj.dottedNameToFullName(name)
+                    references[name] = 1
+                    references[resolved] = 1
+                    if resolved != name:
+                        imported_references[resolved] = 1
                 self.method_func.append(fullname)
+                # Functions defined directly in a class body are methods.
+                if isinstance(obj.parent, Class):
+                    self.methods.append(fullname)
+                else:
+                    self.functions.append(fullname)
             if isinstance(obj.docstring, str) and obj.docstring.strip():
                 self.docstrings.append(fullname)
                 # Check docstring for known documenation formats.
-                formatted = False
+                formats = find_formats(obj.docstring)
                 for format in supported_formats:
-                    if use_format(obj.docstring, format):
+                    if format in formats:
                         self.docstrings_by_format[format].append(fullname)
-                        formatted = True
-                if formatted:
+                if formats:
                     self.formatted_docstrings_count += 1
                 else:
                     self.log(str(fullname) + " has unformated docstrings")
@@ -178,15 +297,8 @@ class CodeParser(object):
                 if get_doctests(obj.docstring):
                     self.doctests_count += 1
 
-        for method_or_func in self.method_func:
-            method_found = 0
-            for cls in self.classes:
-                if method_or_func.startswith(cls):
-                    self.methods.append(method_or_func)
-                    method_found = 1
-                    break
-            if not method_found:
-                self.functions.append(method_or_func)
+        self.references = sorted(references)
+        self.imported_references = sorted(imported_references)
 
         self.log("modules: " + ",".join(self.modules))
         self.log("classes: " + ",".join(self.classes))
@@ -224,6 +336,37 @@ class CodeParser(object):
         """Return list of functions called by functions/methods
         defined in this module.
         """
-        return self.system.func_called.keys()
+        return self.func_called.keys()
 
     functions_called = property(_functions_called)
+
+    def summary(self):
+        """Return results of parsing as a dictionary of plain values.
+
+        Use `from_summary` to get a CodeParser instance back.
+        """
+        summary = {}
+        for name in self.summary_attributes:
+            summary[name] = getattr(self, name)
+        summary['functions_called'] = self.functions_called
+        return summary
+
+    @classmethod
+    def from_summary(cls, summary, log=None):
+        """Create CodeParser instance from results of `summary` method,
+        without parsing anything.
+
+        Parsed `system` is not available for such instance.
+        """
+        code = cls.__new__(cls)
+        if log:
+            code.log = log.codeparser
+        else:
+            code.log = logger.default.codeparser
+
+        for name in cls.summary_attributes:
+            setattr(code, name, summary[name])
+        code.system = None
+        code.func_called = dict.fromkeys(summary['functions_called'], 1)
+
+        return code
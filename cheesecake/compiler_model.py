@@ -0,0 +1,188 @@
+"""Extraction of the code model from syntax trees of the `compiler`
+package.
+
+This is how `model` worked before it moved to the `ast` module. It is
+kept only to compare both (see support/benchmark_parser.py) and goes away
+together with the `compiler` package.
+"""
+
+from compiler import ast
+from compiler.transformer import parse, parseFile
+from compiler.visitor import walk
+
+import ast_pp
+from model import Package, expandModname
+
+
+def get_call_name(node):
+    assert isinstance(node, ast.CallFunc)
+
+    def get_name(node):
+        if isinstance(node, ast.CallFunc):
+            return None
+        elif isinstance(node, ast.Name):
+            return node.name
+        elif isinstance(node, str):
+            return node
+        elif isinstance(node, tuple):
+            if len(node) == 1:
+                return node[0]
+            else:
+                return "%s.%s" % (get_name(node[:-1][0]), node[-1])
+        elif isinstance(node, ast.Getattr):
+            return get_name(node.asList())
+        else:
+            return None
+
+    return get_name(node.node)
+
+
+def get_function_calls(node, fc):
+    if not isinstance(node, ast.Node):
+        return
+
+    for child in node.getChildren():
+        if isinstance(child, ast.CallFunc):
+            func_called = get_call_name(child)
+            if func_called:
+                fc[func_called] = 1
+
+        get_function_calls(child, fc)
+
+
+class CompilerModuleVisitor(object):
+    def __init__(self, system, modname):
+        self.system = system
+        self.modname = modname
+        self.morenodes = []
+
+    def default(self, node):
+        for child in node.getChildNodes():
+            self.visit(child)
+
+    def postpone(self, docable, node):
+        self.morenodes.append((docable, node))
+
+    def visitModule(self, node):
+        if self.system.current and self.modname in self.system.current.contents:
+            m = self.system.current.contents[self.modname]
+            assert m.docstring is None
+            m.docstring = node.doc
+            self.system.push(m, node)
+            self.default(node)
+            self.system.pop(m)
+        else:
+            if not self.system.current:
+                roots = [x for x in self.system.rootobjects if x.name == self.modname]
+                if roots:
+                    mod, = roots
+                    self.system.push(mod, node)
+                    self.default(node)
+                    self.system.pop(mod)
+                    return
+            self.system.pushModule(self.modname, node.doc)
+            self.default(node)
+            self.system.popModule()
+
+    def visitClass(self, node):
+        cls = self.system.pushClass(node.name, node.doc)
+        if node.lineno is not None:
+            cls.linenumber = node.lineno
+        for n in node.bases:
+            str_base = ast_pp.pp(n)
+            cls.rawbases.append(str_base)
+            base = cls.dottedNameToFullName(str_base)
+            cls.bases.append(base)
+        self.default(node)
+        self.system.popClass()
+
+    def visitFrom(self, node):
+        modname = expandModname(self.system, node.modname)
+        current = self.system.current
+        for fromname, asname in node.names:
+            if fromname == '*':
+                self.system.warning("import *", modname)
+                if modname not in self.system.allobjects:
+                    return
+                mod = self.system.allobjects[modname]
+                # this might fail if you have an import-* cycle, or if
+                # you're just not running the import star finder to
+                # save time (not that this is possibly without
+                # commenting stuff out yet, but...)
+                if isinstance(mod, Package):
+                    self.system.warning("import * from a package", modname)
+                    return
+                if mod.processed:
+                    for n in mod.contents:
+                        current.bindName(n, modname + '.' + n)
+                else:
+                    self.system.warning("unresolvable import *", modname)
+                return
+            if asname is None:
+                asname = fromname
+            current.bindName(asname, modname + '.' + fromname)
+
+    def visitImport(self, node):
+        current = self.system.current
+        for fromname, asname in node.names:
+            fullname = expandModname(self.system, fromname)
+            if asname is None:
+                asname = fromname.split('.', 1)[0]
+                # aaaaargh! python sucks.
+                parts = fullname.split('.')
+                for i, part in enumerate(fullname.split('.')[::-1]):
+                    if part == asname:
+                        fullname = '.'.join(parts[:len(parts)-i])
+                        current.bindName(asname, fullname)
+                        break
+                else:
+                    current.bindName(asname, '.'.join(parts))
+            else:
+                current.bindName(asname, fullname)
+
+    def visitFunction(self, node):
+        fc = {}
+        get_function_calls(node, fc)
+        func = self.system.pushFunction(node.name, node.doc, fc)
+        if node.lineno is not None:
+            func.linenumber = node.lineno
+        # ast.Function has a pretty lame representation of
+        # arguments. Let's convert it to a nice concise format
+        # somewhat like what inspect.getargspec returns
+        argnames = node.argnames[:]
+        kwname = starargname = None
+        if node.kwargs:
+            kwname = argnames.pop(-1)
+        if node.varargs:
+            starargname = argnames.pop(-1)
+        defaults = []
+        for default in node.defaults:
+            try:
+                defaults.append(ast_pp.pp(default))
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception, e:
+                self.system.warning("unparseable default", "%s: %s %r" %
+                                    (e.__class__.__name__, e, default))
+                defaults.append('???')
+        # argh, convert unpacked-arguments from tuples to lists,
+        # because that's what getargspec uses and the unit test
+        # compares it
+        argnames2 = []
+        for argname in argnames:
+            if isinstance(argname, tuple):
+                argname = list(argname)
+            argnames2.append(argname)
+        func.argspec = (argnames2, starargname, kwname, tuple(defaults))
+        self.postpone(func, node.code)
+        self.system.popFunction()
+
+
+def processModuleAst(ast, name, system):
+    mv = CompilerModuleVisitor(system, name)
+    walk(ast, mv)
+    while mv.morenodes:
+        obj, node = mv.morenodes.pop(0)
+        system.push(obj, node)
+        mv.visit(node)
+        system.pop(obj)
@@ -0,0 +1,208 @@
+"""Downloading package files over HTTP, reusing connections between
+downloads.
+
+Other URL schemes (like file:// or ftp://) are handled by urllib.
+"""
+
+import httplib
+import os
+import socket
+import threading
+import urllib
+from urlparse import urljoin, urlsplit
+
+from util import COPY_CHUNK_SIZE
+
+
+class HTTPError(IOError):
+    """Server answered with an error status.
+    """
+    def __init__(self, url, code, msg):
+        IOError.__init__(self, "HTTP error %d %s for %s" % (code, msg, url))
+        self.url = url
+        self.code = code
+        self.msg = msg
+
+
+def conditional_headers(headers):
+    """Return request headers that ask server to send the file again only
+    if it has changed since it was sent along with response `headers`.
+
+    Return empty dictionary if response headers give no way to check that.
+    """
+    request_headers = {}
+    etag = headers.getheader('etag')
+    if etag:
+        request_headers['If-None-Match'] = etag
+    last_modified = headers.getheader('last-modified')
+    if last_modified:
+        request_headers['If-Modified-Since'] = last_modified
+    return request_headers
+
+
+class Downloader(object):
+    """Download files, keeping HTTP connections to servers alive between
+    downloads.
+
+    Idle connections are kept in a pool, so one Downloader can be shared by
+    many threads.
+    """
+    connection_classes = {
+        'http': httplib.HTTPConnection,
+        'https': httplib.HTTPSConnection,
+    }
+    max_redirects = 5
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self.idle_connections = {}
+        self.lock = threading.Lock()
+
+    def close(self):
+        """Close all idle connections.
+        """
+        self.lock.acquire()
+        try:
+            for connections in self.idle_connections.values():
+                for connection in connections:
+                    connection.close()
+            self.idle_connections = {}
+        finally:
+            self.lock.release()
+
+    def _get_connection(self, scheme, netloc):
+        """Return (connection, reused) tuple for given server.
+        """
+        self.lock.acquire()
+        try:
+            idle = self.idle_connections.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+        finally:
+            self.lock.release()
+        return self.connection_classes[scheme](netloc,
+                                               timeout=self.timeout), False
+
+    def _release_connection(self, scheme, netloc, connection, response):
+        """Put connection back to the pool, unless server is going to close
+        it.
+        """
+        if response.will_close:
+            connection.close()
+            return
+        self.lock.acquire()
+        try:
+            self.idle_connections.setdefault((scheme, netloc),
+                                             []).append(connection)
+        finally:
+            self.lock.release()
+
+    def _request(self, url, headers):
+        """Send GET request for `url` and return (response, release)
+        tuple, where `release` must be called once response is read.
+        """
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        if query:
+            path += '?' + query
+        path = path or '/'
+
+        while True:
+            connection, reused = self._get_connection(scheme, netloc)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error), e:
+                connection.close()
+                if reused:
+                    # Server has closed idle connection, try a fresh one.
+                    continue
+                if isinstance(e, socket.error):
+                    raise IOError("[Errno socket error] %s" % (e,))
+                raise IOError("[Errno http error] %s" % (e,))
+
+            def release():
+                self._release_connection(scheme, netloc, connection,
+                                         response)
+            return response, release
+
+    def retrieve(self, url, filename, headers=None):
+        """Download `url` to `filename`, streaming it in chunks.
+
+        `headers` are added to the request, which lets the caller make it
+        conditional (see `conditional_headers`).
+
+        Return (filename, response_headers) tuple, like urllib.urlretrieve.
+        If server says file hasn't been modified, return (None,
+        response_headers) without touching `filename`. Raise HTTPError if
+        server answered with an error and IOError if it couldn't be reached
+        or sent less than it announced in Content-Length.
+        """
+        if urlsplit(url)[0] not in self.connection_classes:
+            return urllib.urlretrieve(url, filename)
+
+        request_headers = {'Accept-Encoding': 'identity'}
+        request_headers.update(headers or {})
+
+        for redirect in range(self.max_redirects + 1):
+            response, release = self._request(url, request_headers)
+            location = response.getheader('location')
+            if response.status in (301, 302, 303, 307) and location:
+                response.read()
+                release()
+                url = urljoin(url, location)
+                continue
+            break
+        else:
+            raise IOError("[Errno http error] too many redirects for %s" %
+                          url)
+
+        if response.status == 304:
+            response.read()
+            release()
+            return None, response.msg
+
+        if response.status >= 400:
+            # Read the error page, so that connection can be reused.
+            response.read()
+            release()
+            raise HTTPError(url, response.status, response.reason)
+
+        expected_size = response.getheader('content-length')
+        size = 0
+        output = open(filename, 'wb')
+        try:
+            try:
+                while True:
+                    chunk = response.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    output.write(chunk)
+                    size += len(chunk)
+            except (httplib.HTTPException, socket.error), e:
+                response.close()
+                raise IOError("[Errno socket error] %s" % (e,))
+        finally:
+            output.close()
+
+        # Connection dropped early, don't take a part for the whole file.
+        if expected_size is not None and expected_size.isdigit() and \
+               size != int(expected_size):
+            response.close()
+            os.unlink(filename)
+            raise IOError("[Errno http error] retrieval incomplete: got only "
+                          "%d out of %s bytes for %s" %
+                          (size, expected_size, url))
+        release()
+
+        return filename, response.msg
+
+
+# Downloader shared by all packages scored in this process.
+default_downloader = Downloader()
+
+def urlretrieve(url, filename, headers=None):
+    """Download `url` to `filename` using the shared Downloader.
+
+    See `Downloader.retrieve` for description of arguments and return value.
+    """
+    return default_downloader.retrieve(url, filename, headers)
@@ -8,73 +8,296 @@ http://codespeak.net/svn/user/mwh/docextractor/.
 Changes:
   * do not print warnings to stdout (in System.warning)
   * collect all function calls
+  * use syntax trees of the ast module instead of the compiler package
 """
 
 
-from compiler import ast
+import ast
 import sys
 import os
 import cPickle as pickle
 import __builtin__
+from collections import deque
 
-from compiler.transformer import parse, parseFile
-from compiler.visitor import walk
 
-import ast_pp
+# Fields of syntax tree nodes holding lists of statements.
+STATEMENT_FIELDS = ('body', 'handlers', 'orelse', 'finalbody')
+
+BINARY_OPERATORS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+    ast.FloorDiv: '//', ast.Mod: '%', ast.Pow: '**', ast.LShift: '<<',
+    ast.RShift: '>>', ast.BitOr: '|', ast.BitXor: '^', ast.BitAnd: '&',
+    }
+
+UNARY_OPERATORS = {
+    ast.Invert: '~', ast.Not: 'not ', ast.UAdd: '+', ast.USub: '-',
+    }
+
+COMPARISON_OPERATORS = {
+    ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>',
+    ast.GtE: '>=', ast.Is: 'is', ast.IsNot: 'is not', ast.In: 'in',
+    ast.NotIn: 'not in',
+    }
+
+# Fields of syntax tree nodes which hold names, constants or operators,
+# so can't contain function calls.
+LEAF_FIELDS = set(['arg', 'asname', 'attr', 'ctx', 'id', 'kwarg', 'level',
+                   'module', 'n', 'name', 'names', 'nl', 'op', 'ops', 's',
+                   'vararg'])
+
+# Node class -> list of its fields which may contain function calls.
+node_fields = {}
+
+
+def parse(source, filename='<unknown>'):
+    return ast.parse(source, filename)
+
+
+def parseFile(path):
+    fd = open(path, 'U')
+    source = fd.read()
+    fd.close()
+    return parse(source + '\n', path)
+
+
+class SourceWriter(ast.NodeVisitor):
+    """Write source code of an expression, the way ast_pp does for
+    syntax trees of the compiler package.
+    """
+    def __init__(self):
+        self.parts = []
+
+    def w(self, s):
+        self.parts.append(s)
+
+    def sequence(self, nodes, separator=', '):
+        for i, node in enumerate(nodes):
+            if i:
+                self.w(separator)
+            self.visit(node)
+
+    def visit_Name(self, node):
+        self.w(node.id)
+
+    def visit_Attribute(self, node):
+        self.visit(node.value)
+        self.w('.')
+        self.w(node.attr)
+
+    def visit_Call(self, node):
+        self.visit(node.func)
+        self.w('(')
+        self.sequence(node.args + node.keywords)
+        self.w(')')
+
+    def visit_keyword(self, node):
+        self.w(node.arg)
+        self.w('=')
+        self.visit(node.value)
+
+    def visit_Str(self, node):
+        self.w(repr(node.s))
+
+    def visit_Num(self, node):
+        self.w(repr(node.n))
+
+    def visit_Tuple(self, node):
+        self.w('(')
+        self.sequence(node.elts)
+        if len(node.elts) == 1:
+            self.w(',')
+        self.w(')')
+
+    def visit_List(self, node):
+        self.w('[')
+        self.sequence(node.elts)
+        self.w(']')
+
+    def visit_Dict(self, node):
+        self.w('{')
+        for key, value in zip(node.keys, node.values):
+            self.visit(key)
+            self.w(':')
+            self.visit(value)
+            self.w(',')
+        self.w('}')
+
+    def visit_Lambda(self, node):
+        self.w('lambda')
+        args = node.args
+        names = [pp(arg) for arg in args.args]
+        for i, default in enumerate(args.defaults):
+            names[len(names) - len(args.defaults) + i] += '=' + pp(default)
+        if args.vararg:
+            names.append('*' + args.vararg)
+        if args.kwarg:
+            names.append('**' + args.kwarg)
+        if names:
+            self.w(' ' + ', '.join(names))
+        self.w(': ')
+        self.visit(node.body)
+
+    def visit_Subscript(self, node):
+        self.visit(node.value)
+        self.w('[')
+        self.visit(node.slice)
+        self.w(']')
+
+    def visit_Slice(self, node):
+        if node.lower:
+            self.visit(node.lower)
+        self.w(':')
+        if node.upper:
+            self.visit(node.upper)
+
+    def visit_UnaryOp(self, node):
+        self.w(UNARY_OPERATORS[node.op.__class__])
+        self.visit(node.operand)
+
+    def visit_BinOp(self, node):
+        self.visit(node.left)
+        self.w(' %s ' % BINARY_OPERATORS[node.op.__class__])
+        self.visit(node.right)
+
+    def visit_Compare(self, node):
+        self.visit(node.left)
+        for op, right in zip(node.ops, node.comparators):
+            self.w(' %s ' % COMPARISON_OPERATORS[op.__class__])
+            self.visit(right)
+
+    def __str__(self):
+        return ''.join(self.parts)
+
+
+def pp(node):
+    sw = SourceWriter()
+    sw.visit(node)
+    return str(sw)
 
 
 def get_call_name(node):
-    assert isinstance(node, ast.CallFunc)
+    assert isinstance(node, ast.Call)
 
     def get_name(node):
-        if isinstance(node, ast.CallFunc):
-            return None
-        elif isinstance(node, ast.Name):
-            return node.name
-        elif isinstance(node, str):
-            return node
-        elif isinstance(node, tuple):
-            if len(node) == 1:
-                return node[0]
-            else:
-                return "%s.%s" % (get_name(node[:-1][0]), node[-1])
-        elif isinstance(node, ast.Getattr):
-            return get_name(node.asList())
+        if isinstance(node, ast.Name):
+            return node.id
+        elif isinstance(node, ast.Attribute):
+            return "%s.%s" % (get_name(node.value), node.attr)
         else:
             return None
 
-    return get_name(node.node)
+    return get_name(node.func)
 
 
 def get_function_calls(node, fc):
-    if not isinstance(node, ast.Node):
-        return
-
-    for child in node.getChildren():
-        if isinstance(child, ast.CallFunc):
-            func_called = get_call_name(child)
+    # Nested functions are skipped, ModuleVistor visits them on their own.
+    function = node
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        cls = node.__class__
+        if cls is ast.Call:
+            func_called = get_call_name(node)
             if func_called:
                 fc[func_called] = 1
+        elif cls is ast.FunctionDef and node is not function:
+            continue
+        try:
+            fields = node_fields[cls]
+        except KeyError:
+            fields = node_fields[cls] = [field for field in cls._fields
+                                         if field not in LEAF_FIELDS]
+        for field in fields:
+            child = getattr(node, field)
+            if isinstance(child, list):
+                nodes.extend(child)
+            elif isinstance(child, ast.AST):
+                nodes.append(child)
+
+
+def get_argument_name(node):
+    # Convert unpacked arguments from tuples to lists, because that's what
+    # inspect.getargspec does. Nested ones stay tuples, as they used to.
+    if isinstance(node, ast.Tuple):
+        return [get_nested_argument_name(elt) for elt in node.elts]
+    return node.id
+
+
+def get_nested_argument_name(node):
+    if isinstance(node, ast.Tuple):
+        return tuple([get_nested_argument_name(elt) for elt in node.elts])
+    return node.id
+
 
-        get_function_calls(child, fc)
+class FrozenDict(dict):
+    """Read-only dictionary.
+    """
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwds):
+        raise TypeError("%s is read-only" % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = \
+        update = _readonly
+
+
+# Empty containers shared by all objects that have no contents of their own.
+EMPTY_DICT = FrozenDict()
+EMPTY_LIST = ()
+
+
+def slotNames(cls):
+    names = []
+    for klass in cls.__mro__:
+        names.extend(klass.__dict__.get('__slots__', ()))
+    return names
 
 
 class Documentable(object):
+    # Parsing a large package creates lots of these objects, so they use
+    # slots instead of instance dictionaries, and share empty containers
+    # until something is added to them (see addContent and bindName).
+    __slots__ = ('system', 'prefix', '_name', '_fullName', 'docstring',
+                 'parent', 'contents', 'orderedcontents', '_name2fullname',
+                 'linenumber', '_references')
+
     def __init__(self, system, prefix, name, docstring, parent=None):
         self.system = system
-        self.prefix = prefix
+        self.prefix = intern(prefix)
         self.name = name
         self.docstring = docstring
         self.parent = parent
         self.setup()
 
     def setup(self):
-        self.contents = {}
-        self.orderedcontents = []
-        self._name2fullname = {}
+        self.contents = EMPTY_DICT
+        self.orderedcontents = EMPTY_LIST
+        self._name2fullname = EMPTY_DICT
+
+    def _get_name(self):
+        return self._name
+
+    def _set_name(self, name):
+        self._name = intern(name)
+        self._fullName = self.prefix + self._name
+
+    name = property(_get_name, _set_name)
 
     def fullName(self):
-        return self.prefix + self.name
+        return self._fullName
+
+    def addContent(self, obj):
+        if self.orderedcontents is EMPTY_LIST:
+            self.contents = {}
+            self.orderedcontents = []
+        self.orderedcontents.append(obj)
+        self.contents[obj.name] = obj
+        self.bindName(obj.name, obj.fullName())
+
+    def bindName(self, name, fullname):
+        if self._name2fullname is EMPTY_DICT:
+            self._name2fullname = {}
+        self._name2fullname[name] = fullname
 
     def shortdocstring(self):
         docstring = self.docstring
@@ -150,7 +373,12 @@ class Documentable(object):
         # this is so very, very evil.
         # see doc/extreme-pickling-pain.txt for more.
         r = {}
-        for k, v in self.__dict__.iteritems():
+        for k in slotNames(self.__class__):
+            if k == '_fullName' or not hasattr(self, k):
+                continue
+            v = getattr(self, k)
+            if v is EMPTY_DICT or v is EMPTY_LIST:
+                continue
             if isinstance(v, Documentable):
                 r['$'+k] = v.fullName()
             elif isinstance(v, list) and v:
@@ -180,8 +408,21 @@ class Documentable(object):
                 r[k] = v
         return r
 
+    def __setstate__(self, state):
+        # References to other objects are resolved by System.__setstate__.
+        self.setup()
+        self._references = {}
+        for k, v in state.iteritems():
+            if k[0] in '$@!':
+                self._references[k] = v
+            else:
+                setattr(self, k, v)
+        self.prefix = intern(self.prefix)
+        self.name = self._name
+
 
 class Package(Documentable):
+    __slots__ = ()
     kind = "Package"
 
     def name2fullname(self, name):
@@ -189,6 +430,7 @@ class Package(Documentable):
 
 
 class Module(Documentable):
+    __slots__ = ('filepath', 'processed')
     kind = "Module"
 
     def name2fullname(self, name):
@@ -202,6 +444,7 @@ class Module(Documentable):
 
 
 class Class(Documentable):
+    __slots__ = ('bases', 'rawbases', 'baseobjects', 'subclasses')
     kind = "Class"
 
     def setup(self):
@@ -213,29 +456,37 @@ class Class(Documentable):
 
 
 class Function(Documentable):
+    __slots__ = ('argspec', 'calls')
     kind = "Function"
 
 
-class ModuleVistor(object):
+class ModuleVistor(ast.NodeVisitor):
     def __init__(self, system, modname):
         self.system = system
         self.modname = modname
-        self.morenodes = []
-
-    def default(self, node):
-        for child in node.getChildNodes():
-            self.visit(child)
+        self.morenodes = deque()
+
+    def generic_visit(self, node):
+        # Classes, functions and imports are all statements, so there is
+        # no need to look into expressions.
+        for field in STATEMENT_FIELDS:
+            children = getattr(node, field, None)
+            # Body of the exec statement is an expression.
+            if isinstance(children, list):
+                for child in children:
+                    self.visit(child)
 
     def postpone(self, docable, node):
         self.morenodes.append((docable, node))
 
-    def visitModule(self, node):
+    def visit_Module(self, node):
+        doc = ast.get_docstring(node, clean=False)
         if self.system.current and self.modname in self.system.current.contents:
             m = self.system.current.contents[self.modname]
             assert m.docstring is None
-            m.docstring = node.doc
+            m.docstring = doc
             self.system.push(m, node)
-            self.default(node)
+            self.generic_visit(node)
             self.system.pop(m)
         else:
             if not self.system.current:
@@ -243,29 +494,32 @@ class ModuleVistor(object):
                 if roots:
                     mod, = roots
                     self.system.push(mod, node)
-                    self.default(node)
+                    self.generic_visit(node)
                     self.system.pop(mod)
                     return
-            self.system.pushModule(self.modname, node.doc)
-            self.default(node)
+            self.system.pushModule(self.modname, doc)
+            self.generic_visit(node)
             self.system.popModule()
 
-    def visitClass(self, node):
-        cls = self.system.pushClass(node.name, node.doc)
-        if node.lineno is not None:
-            cls.linenumber = node.lineno
+    def visit_ClassDef(self, node):
+        cls = self.system.pushClass(node.name,
+                                    ast.get_docstring(node, clean=False))
+        cls.linenumber = node.lineno
         for n in node.bases:
-            str_base = ast_pp.pp(n)
+            str_base = pp(n)
             cls.rawbases.append(str_base)
             base = cls.dottedNameToFullName(str_base)
             cls.bases.append(base)
-        self.default(node)
+        self.generic_visit(node)
         self.system.popClass()
 
-    def visitFrom(self, node):
-        modname = expandModname(self.system, node.modname)
-        name2fullname = self.system.current._name2fullname
-        for fromname, asname in node.names:
+    def visit_ImportFrom(self, node):
+        # Relative imports have no module name when importing from a
+        # package ("from . import x").
+        modname = expandModname(self.system, node.module or '')
+        current = self.system.current
+        for alias in node.names:
+            fromname, asname = alias.name, alias.asname
             if fromname == '*':
                 self.system.warning("import *", modname)
                 if modname not in self.system.allobjects:
@@ -280,17 +534,18 @@ class ModuleVistor(object):
                     return
                 if mod.processed:
                     for n in mod.contents:
-                        name2fullname[n] = modname + '.' + n
+                        current.bindName(n, modname + '.' + n)
                 else:
                     self.system.warning("unresolvable import *", modname)
                 return
             if asname is None:
                 asname = fromname
-            name2fullname[asname] = modname + '.' + fromname
+            current.bindName(asname, modname + '.' + fromname)
 
-    def visitImport(self, node):
-        name2fullname = self.system.current._name2fullname
-        for fromname, asname in node.names:
+    def visit_Import(self, node):
+        current = self.system.current
+        for alias in node.names:
+            fromname, asname = alias.name, alias.asname
             fullname = expandModname(self.system, fromname)
             if asname is None:
                 asname = fromname.split('.', 1)[0]
@@ -299,48 +554,38 @@ class ModuleVistor(object):
                 for i, part in enumerate(fullname.split('.')[::-1]):
                     if part == asname:
                         fullname = '.'.join(parts[:len(parts)-i])
-                        name2fullname[asname] = fullname
+                        current.bindName(asname, fullname)
                         break
                 else:
-                    name2fullname[asname] = '.'.join(parts)
+                    current.bindName(asname, '.'.join(parts))
             else:
-                name2fullname[asname] = fullname
+                current.bindName(asname, fullname)
 
-    def visitFunction(self, node):
+    def visit_FunctionDef(self, node):
         fc = {}
         get_function_calls(node, fc)
-        func = self.system.pushFunction(node.name, node.doc, fc)
-        if node.lineno is not None:
-            func.linenumber = node.lineno
-        # ast.Function has a pretty lame representation of
-        # arguments. Let's convert it to a nice concise format
-        # somewhat like what inspect.getargspec returns
-        argnames = node.argnames[:]
-        kwname = starargname = None
-        if node.kwargs:
-            kwname = argnames.pop(-1)
-        if node.varargs:
-            starargname = argnames.pop(-1)
+        func = self.system.pushFunction(node.name,
+                                        ast.get_docstring(node, clean=False),
+                                        fc)
+        # For decorated functions (and classes) this is the line of the
+        # first decorator, like in the function's code object.
+        func.linenumber = node.lineno
+        # Convert arguments to a nice concise format somewhat like what
+        # inspect.getargspec returns
+        args = node.args
         defaults = []
-        for default in node.defaults:
+        for default in args.defaults:
             try:
-                defaults.append(ast_pp.pp(default))
+                defaults.append(pp(default))
             except (KeyboardInterrupt, SystemExit):
                 raise
             except Exception, e:
                 self.system.warning("unparseable default", "%s: %s %r" %
                                     (e.__class__.__name__, e, default))
                 defaults.append('???')
-        # argh, convert unpacked-arguments from tuples to lists,
-        # because that's what getargspec uses and the unit test
-        # compares it
-        argnames2 = []
-        for argname in argnames:
-            if isinstance(argname, tuple):
-                argname = list(argname)
-            argnames2.append(argname)
-        func.argspec = (argnames2, starargname, kwname, tuple(defaults))
-        self.postpone(func, node.code)
+        func.argspec = ([get_argument_name(arg) for arg in args.args],
+                        args.vararg, args.kwarg, tuple(defaults))
+        self.postpone(func, node)
         self.system.popFunction()
 
 states = [
@@ -384,9 +629,7 @@ class System(object):
             parent = None
         obj = cls(self, prefix, name, docstring, parent)
         if parent:
-            parent.orderedcontents.append(obj)
-            parent.contents[name] = obj
-            parent._name2fullname[name] = obj.fullName()
+            parent.addContent(obj)
         else:
             self.rootobjects.append(obj)
         self.current = obj
@@ -454,7 +697,10 @@ class System(object):
 
     def pushFunction(self, name, docstring, func_called):
         self.func_called.update(func_called)
-        return self._push(self.Function, name, docstring)
+        func = self._push(self.Function, name, docstring)
+        # Names of called functions, as written in the function's scope.
+        func.calls = func_called
+        return func
 
     def popFunction(self):
         self._pop(self.Function)
@@ -532,10 +778,9 @@ class System(object):
         # see doc/extreme-pickling-pain.txt for more.
         self.__dict__.update(state)
         for obj in self.orderedallobjects:
-            for k, v in obj.__dict__.copy().iteritems():
+            for k, v in obj._references.iteritems():
                 if k.startswith('$'):
-                    del obj.__dict__[k]
-                    obj.__dict__[k[1:]] = self.allobjects[v]
+                    v = self.allobjects[v]
                 elif k.startswith('@'):
                     n = []
                     for vv in v:
@@ -543,15 +788,14 @@ class System(object):
                             n.append(None)
                         else:
                             n.append(self.allobjects[vv])
-                    del obj.__dict__[k]
-                    obj.__dict__[k[1:]] = n
+                    v = n
                 elif k.startswith('!'):
                     n = {}
                     for kk, vv in v.iteritems():
                         n[kk] = self.allobjects[vv]
-                    del obj.__dict__[k]
-                    obj.__dict__[k[1:]] = n
-
+                    v = n
+                setattr(obj, k[1:], v)
+            del obj._references
 
 def expandModname(system, modname, givewarning=True):
     c = system.current
@@ -574,25 +818,26 @@ def expandModname(system, modname, givewarning=True):
         return prefix + suffix
 
 
-class ImportStarFinder(object):
+class ImportStarFinder(ast.NodeVisitor):
     def __init__(self, system, modfullname):
         self.system = system
         self.modfullname = modfullname
 
-    def visitFrom(self, node):
-        if node.names[0][0] == '*':
-            modname = expandModname(self.system, node.modname, False)
+    def visit_ImportFrom(self, node):
+        if node.names[0].name == '*':
+            modname = expandModname(self.system, node.module or '', False)
             self.system.importstargraph.setdefault(
                 self.modfullname, []).append(modname)
 
 
 def processModuleAst(ast, name, system):
     mv = system.ModuleVistor(system, name)
-    walk(ast, mv)
+    mv.visit(ast)
+    # Function bodies are processed once their enclosing scope is done.
     while mv.morenodes:
-        obj, node = mv.morenodes.pop(0)
+        obj, node = mv.morenodes.popleft()
         system.push(obj, node)
-        mv.visit(node)
+        mv.generic_visit(node)
         system.pop(obj)
 
 
@@ -638,7 +883,7 @@ def findImportStars(system):
             ast = parseFile(mod.filepath)
         except (SyntaxError, ValueError):
             system.warning("cannot parse", mod.filepath)
-        walk(ast, isf)
+        isf.visit(ast)
         system.pop(mod.parent)
     system.state = 'importstarred'
 
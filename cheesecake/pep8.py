@@ -83,6 +83,8 @@ import sys
 import re
 import time
 import inspect
+import multiprocessing
+import threading
 import tokenize
 from argparse import ArgumentParser
 from keyword import iskeyword
@@ -103,9 +105,6 @@ operators = """
 in is or not and
 """.split()
 
-arguments = None
-args = None
-
 
 ##############################################################################
 # Plugins (check functions) for physical lines
@@ -368,7 +367,7 @@ def expand_indent(line):
 
 def message(text):
     """Print a message."""
-    # print(arguments.prog + ': ' + text, file=sys.stderr)
+    # print(options.prog + ': ' + text, file=sys.stderr)
     # print(text, file=sys.stderr)
     print(text)
 
@@ -417,15 +416,24 @@ def mute_string(text):
 class Checker:
     """
     Load a Python source file, tokenize it, check coding style.
+
+    Options and counters are kept in the report. When it isn't given,
+    a new one with default options is made.
     """
 
-    def __init__(self, filename):
+    def __init__(self, filename, lines=None, tokens=None, report=None):
         self.filename = filename
-        self.lines = file(filename).readlines()
+        if lines is None:
+            lines = file(filename).readlines()
+        self.lines = lines
+        self.source_tokens = tokens
+        if report is None:
+            report = Report()
+        self.report = report
+        self.options = report.options
         self.physical_checks = find_checks('physical_line')
         self.logical_checks = find_checks('logical_line')
-        arguments.counters['physical lines'] = \
-            arguments.counters.get('physical lines', 0) + len(self.lines)
+        report.increment('physical lines', len(self.lines))
 
     def readline(self):
         """
@@ -445,6 +453,16 @@ class Checker:
         self.check_physical(line)
         return line
 
+    def replay_tokens(self):
+        """
+        Yield tokens given to the constructor, checking physical lines
+        in the same order as tokenizing with readline_check_physical would.
+        """
+        for token in self.source_tokens:
+            while self.line_number < min(token[3][0], len(self.lines)):
+                self.readline_check_physical()
+            yield token
+
     def run_check(self, check, argument_names):
         """
         Run a check plugin.
@@ -502,16 +520,15 @@ class Checker:
         """
         Build a line from tokens and run all logical checks on it.
         """
-        arguments.counters['logical lines'] = \
-            arguments.counters.get('logical lines', 0) + 1
+        self.report.increment('logical lines')
         self.build_tokens_line()
         first_line = self.lines[self.mapping[0][1][2][0] - 1]
         indent = first_line[:self.mapping[0][1][2][1]]
         self.indent_level = expand_indent(indent)
-        if arguments.verbose >= 2:
+        if self.options.verbose >= 2:
             print(self.logical_line[:80].rstrip())
         for name, check, argument_names in self.logical_checks:
-            if arguments.verbose >= 3:
+            if self.options.verbose >= 3:
                 print('   ', name)
             result = self.run_check(check, argument_names)
             if result is not None:
@@ -536,7 +553,11 @@ class Checker:
         self.state = {'blank_lines': 0}
         self.tokens = []
         parens = 0
-        for token in tokenize.generate_tokens(self.readline_check_physical):
+        if self.source_tokens is None:
+            tokens = tokenize.generate_tokens(self.readline_check_physical)
+        else:
+            tokens = self.replay_tokens()
+        for token in tokens:
             # print tokenize.tok_name[token[0]], repr(token)
             self.tokens.append(token)
             token_type, text = token[0:2]
@@ -555,157 +576,239 @@ class Checker:
 
     def report_error(self, line_number, offset, text, check):
         """
-        Report an error, according to arguments.
+        Report an error, according to options.
         """
-        if arguments.quiet == 1 and not self.file_errors:
+        options = self.options
+        if options.quiet == 1 and not self.file_errors:
             message(self.filename)
         self.file_errors += 1
         code = text[:4]
-        arguments.counters[code] = arguments.counters.get(code, 0) + 1
-        arguments.messages[code] = text[5:]
-        if arguments.quiet:
+        count = self.report.add_message(code, text[5:])
+        if options.quiet:
             return
-        if arguments.testsuite:
+        if options.testsuite:
             base = os.path.basename(self.filename)[:4]
             if base == code:
                 return
             if base[0] == 'E' and code[0] == 'W':
                 return
-        if ignore_code(code):
+        if self.report.ignore_code(code):
             return
-        if arguments.counters[code] == 1 or arguments.repeat:
+        if count == 1 or options.repeat:
             message("%s:%s:%d: %s" %
                     (self.filename, line_number, offset + 1, text))
-            if arguments.show_source:
+            if options.show_source:
                 line = self.lines[line_number - 1]
                 message(line.rstrip())
                 message(' ' * offset + '^')
-            if arguments.show_pep8:
+            if options.show_pep8:
                 message(check.__doc__.lstrip('\n').rstrip())
 
 
-def input_file(filename):
+class Report:
     """
-    Run all checks on a Python source file.
-    """
-    if excluded(filename) or not filename_match(filename):
-        return {}
-    if arguments.verbose:
-        message('checking ' + filename)
-    arguments.counters['files'] = arguments.counters.get('files', 0) + 1
-    errors = Checker(filename).check_all()
-    if arguments.testsuite and not errors:
-        message("%s: %s" % (filename, "no errors found"))
-
+    Options of a pep8 run and counters of everything it has found.
 
-def input_dir(dirname):
+    Each report is independent of others, so many of them may be used
+    at the same time, e.g. from different threads.
     """
-    Check all Python source files in this directory and all subdirectories.
-    """
-    dirname = dirname.rstrip('/')
-    if excluded(dirname):
-        return
-    for root, dirs, files in os.walk(dirname):
-        if arguments.verbose:
-            message('directory ' + root)
-        arguments.counters['directories'] = \
-            arguments.counters.get('directories', 0) + 1
-        dirs.sort()
-        for subdir in dirs:
-            if excluded(subdir):
-                dirs.remove(subdir)
-        files.sort()
-        for filename in files:
-            input_file(os.path.join(root, filename))
-
-
-def excluded(filename):
-    """
-    Check if arguments.exclude contains a pattern that matches filename.
-    """
-    for pattern in arguments.exclude:
-        if fnmatch(filename, pattern):
-            return True
 
+    def __init__(self, options=None):
+        if options is None:
+            options = parse_options([])
+        self.options = options
+        self.counters = {}
+        self.messages = {}
+        # Counters are updated from Checker instances, which may run in
+        # different threads.
+        self.lock = threading.Lock()
 
-def filename_match(filename):
-    """
-    Check if arguments.filename contains a pattern that matches filename.
-    If arguments.filename is unspecified, this always returns True.
-    """
-    if not arguments.filename:
-        return True
-    for pattern in arguments.filename:
-        if fnmatch(filename, pattern):
-            return True
+    def increment(self, key, count=1):
+        """
+        Add count to the counter of given key.
+        """
+        self.lock.acquire()
+        try:
+            self.counters[key] = self.counters.get(key, 0) + count
+        finally:
+            self.lock.release()
 
+    def add_message(self, code, text):
+        """
+        Count one occurrence of message with given code and return the
+        number of its occurrences so far.
+        """
+        self.lock.acquire()
+        try:
+            self.counters[code] = self.counters.get(code, 0) + 1
+            self.messages[code] = text
+            return self.counters[code]
+        finally:
+            self.lock.release()
+
+    def merge(self, counters, messages):
+        """
+        Add counters and messages found by other run, e.g. by other report.
+        """
+        self.lock.acquire()
+        try:
+            for key, count in counters.iteritems():
+                self.counters[key] = self.counters.get(key, 0) + count
+            self.messages.update(messages)
+        finally:
+            self.lock.release()
+
+    def input_file(self, filename, lines=None, tokens=None):
+        """
+        Run all checks on a Python source file.
 
-def ignore_code(code):
-    """
-    Check if arguments.ignore contains a prefix of the error code.
-    """
-    for ignore in arguments.ignore:
-        if code.startswith(ignore):
-            return True
+        Lines and tokens of the file may be given if they're already known.
+        """
+        if self.excluded(filename) or not self.filename_match(filename):
+            return {}
+        if self.options.verbose:
+            message('checking ' + filename)
+        self.increment('files')
+        errors = Checker(filename, lines, tokens, self).check_all()
+        if self.options.testsuite and not errors:
+            message("%s: %s" % (filename, "no errors found"))
+
+    def input_files(self, filenames, jobs=1):
+        """
+        Run all checks on given Python source files, using a pool of
+        jobs processes.
 
+        Each worker process returns counters and messages of its own,
+        which are merged in files order, so the statistics are the same
+        as when checking the files one after another.
+        """
+        if jobs <= 1 or len(filenames) <= 1:
+            for filename in filenames:
+                self.input_file(filename)
+            return
 
-def get_error_statistics():
-    """Get error statistics."""
-    return get_statistics("E")
+        pool = multiprocessing.Pool(min(jobs, len(filenames)))
+        try:
+            results = pool.map(check_file, [(self.options, filename)
+                                            for filename in filenames])
+        finally:
+            pool.close()
+            pool.join()
 
+        for counters, messages in results:
+            self.merge(counters, messages)
 
-def get_warning_statistics():
-    """Get warning statistics."""
-    return get_statistics("W")
+    def input_dir(self, dirname):
+        """
+        Check all Python source files in this directory and all
+        subdirectories.
+        """
+        dirname = dirname.rstrip('/')
+        if self.excluded(dirname):
+            return
+        for root, dirs, files in os.walk(dirname):
+            if self.options.verbose:
+                message('directory ' + root)
+            self.increment('directories')
+            dirs.sort()
+            for subdir in dirs:
+                if self.excluded(subdir):
+                    dirs.remove(subdir)
+            files.sort()
+            for filename in files:
+                self.input_file(os.path.join(root, filename))
+
+    def excluded(self, filename):
+        """
+        Check if options.exclude contains a pattern that matches filename.
+        """
+        for pattern in self.options.exclude:
+            if fnmatch(filename, pattern):
+                return True
 
+    def filename_match(self, filename):
+        """
+        Check if options.filename contains a pattern that matches filename.
+        If options.filename is unspecified, this always returns True.
+        """
+        if not self.options.filename:
+            return True
+        for pattern in self.options.filename:
+            if fnmatch(filename, pattern):
+                return True
 
-def get_statistics(prefix=''):
-    """
-    Get statistics for message codes that start with the prefix.
+    def ignore_code(self, code):
+        """
+        Check if options.ignore contains a prefix of the error code.
+        """
+        for ignore in self.options.ignore:
+            if code.startswith(ignore):
+                return True
 
-    prefix='' matches all errors and warnings
-    prefix='E' matches all errors
-    prefix='W' matches all warnings
-    prefix='E4' matches all errors that have to do with imports
-    """
-    stats = []
-    keys = arguments.messages.keys()
-    keys.sort()
-    for key in keys:
-        if key.startswith(prefix):
-            stats.append('%-7s %s %s' %
-                         (arguments.counters[key], key, arguments.messages[key]))
-    return stats
+    def get_error_statistics(self):
+        """Get error statistics."""
+        return self.get_statistics("E")
 
+    def get_warning_statistics(self):
+        """Get warning statistics."""
+        return self.get_statistics("W")
+
+    def get_statistics(self, prefix=''):
+        """
+        Get statistics for message codes that start with the prefix.
 
-def print_statistics(prefix=''):
-    """Print overall statistics (number of errors and warnings)."""
-    for line in get_statistics(prefix):
-        print(line)
+        prefix='' matches all errors and warnings
+        prefix='E' matches all errors
+        prefix='W' matches all warnings
+        prefix='E4' matches all errors that have to do with imports
+        """
+        stats = []
+        keys = self.messages.keys()
+        keys.sort()
+        for key in keys:
+            if key.startswith(prefix):
+                stats.append('%-7s %s %s' %
+                             (self.counters[key], key, self.messages[key]))
+        return stats
+
+    def print_statistics(self, prefix=''):
+        """Print overall statistics (number of errors and warnings)."""
+        for line in self.get_statistics(prefix):
+            print(line)
+
+    def print_benchmark(self, elapsed):
+        """
+        Print benchmark numbers.
+        """
+        print('%-7.2f %s' % (elapsed, 'seconds elapsed'))
+        keys = ['directories', 'files',
+                'logical lines', 'physical lines']
+        for key in keys:
+            if key in self.counters:
+                print('%-7d %s per second (%d total)' % (
+                      self.counters[key] / elapsed, key,
+                      self.counters[key]))
 
 
-def print_benchmark(elapsed):
+def check_file(args):
     """
-    Print benchmark numbers.
+    Check one file with given options and return counters and messages.
+
+    Used by Report.input_files worker processes, args is a tuple of
+    options and file name.
     """
-    print('%-7.2f %s' % (elapsed, 'seconds elapsed'))
-    keys = ['directories', 'files',
-            'logical lines', 'physical lines']
-    for key in keys:
-        if key in arguments.counters:
-            print('%-7d %s per second (%d total)' % (
-                  arguments.counters[key] / elapsed, key,
-                  arguments.counters[key]))
+    options, filename = args
+    report = Report(options)
+    report.input_file(filename)
+    return report.counters, report.messages
 
 
-def process_arguments(arglist=None):
+def get_parser():
     """
-    Process arguments passed either via optional arguments or positional
-    arguments.
+    Return parser of command line arguments.
     """
-    global arguments, args
-    usage = "%prog [arguments] input ..."
-    parser = ArgumentParser(usage)
+    usage = "%(prog)s [options] input ..."
+    parser = ArgumentParser(usage=usage)
     parser.add_argument('-v', '--verbose', default=0, action='count',
                         help="print status messages, or debug with -vv")
     parser.add_argument('-q', '--quiet', default=0, action='count',
@@ -734,49 +837,65 @@ def process_arguments(arglist=None):
                         help="run doctest on myself")
 
     # handle positional arguments
-    parser.add_argument('paths', nargs='?')
-
-    arguments = parser.parse_args(arglist)
-    args = arguments.paths
-    if arguments.testsuite:
-        args.append(arguments.testsuite)
-    if len(args) == 0:
-        parser.error('input not specified')
-    arguments.prog = os.path.basename(sys.argv[0])
-    arguments.exclude = arguments.exclude.split(',')
-    for index in range(len(arguments.exclude)):
-        arguments.exclude[index] = arguments.exclude[index].rstrip('/')
-    if arguments.filename:
-        arguments.filename = arguments.filename.split(',')
-    if arguments.ignore:
-        arguments.ignore = arguments.ignore.split(',')
+    parser.add_argument('paths', nargs='*')
+
+    return parser
+
+
+def parse_options(arglist=None):
+    """
+    Parse options from the list of arguments (sys.argv[1:] by default).
+
+    Input paths, if any, are left in the paths attribute.
+    """
+    options = get_parser().parse_args(arglist)
+    options.prog = os.path.basename(sys.argv[0])
+    options.exclude = options.exclude.split(',')
+    for index in range(len(options.exclude)):
+        options.exclude[index] = options.exclude[index].rstrip('/')
+    if options.filename:
+        options.filename = options.filename.split(',')
+    if options.ignore:
+        options.ignore = options.ignore.split(',')
     else:
-        arguments.ignore = []
-    arguments.counters = {}
-    arguments.messages = {}
+        options.ignore = []
+    return options
 
-    return arguments, args
+
+def process_arguments(arglist=None):
+    """
+    Process arguments passed either via optional arguments or positional
+    arguments. Return options and list of input paths.
+    """
+    options = parse_options(arglist)
+    args = list(options.paths)
+    if options.testsuite:
+        args.append(options.testsuite)
+    if len(args) == 0 and not options.doctest:
+        get_parser().error('input not specified')
+    return options, args
 
 
 def _main():
     """
     Parse arguments and run checks on Python source.
     """
-    arguments, args = process_arguments()
-    if arguments.doctest:
+    options, args = process_arguments()
+    if options.doctest:
         import doctest
         return doctest.testmod()
+    report = Report(options)
     start_time = time.time()
     for path in args:
         if os.path.isdir(path):
-            input_dir(path)
+            report.input_dir(path)
         else:
-            input_file(path)
+            report.input_file(path)
     elapsed = time.time() - start_time
-    if arguments.statistics:
-        print_statistics()
-    if arguments.benchmark:
-        print_benchmark(elapsed)
+    if options.statistics:
+        report.print_statistics()
+    if options.benchmark:
+        report.print_benchmark(elapsed)
 
 
 if __name__ == '__main__':
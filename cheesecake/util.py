@@ -1,28 +1,145 @@
 """Utility functions for Cheesecake project.
 """
 
+import cPickle as pickle
+import errno
+import multiprocessing
 import os
+import select
 import shutil
 import signal
 import stat
 import sys
 import tarfile
 import tempfile
+import threading
 import time
+import traceback
 import zipfile
 
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+try:
+    import resource
+except ImportError:
+    # Resource limits are not available on this platform.
+    resource = None
+
 from subprocess import call, ProcessError, Popen, PIPE, STDOUT
 
 PAD_TEXT = 40
 PAD_VALUE = 4
 
+# Size of chunks in which archive members are copied to disk.
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Seconds given to an interrupted command to exit before it's killed.
+KILL_TIMEOUT = 5
+
 def make_temp_file():
     tmpfd, tmpname = tempfile.mkstemp()
     return os.fdopen(tmpfd, 'w+'), tmpname
 
-def run_cmd(cmd, env=None, max_timeout=None):
+def set_limits(limits):
+    """Lower resource limits of current process.
+
+    `limits` maps names of resources, like 'CPU' (seconds) or 'AS' (bytes),
+    to their maximum values. Does nothing on platforms which don't support
+    resource limits.
+    """
+    if resource is None:
+        return
+
+    for name, value in limits.items():
+        limit = getattr(resource, 'RLIMIT_' + name)
+        soft, hard = resource.getrlimit(limit)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        resource.setrlimit(limit, (value, hard))
+
+class OutputReader(object):
+    """Collect output of a process into `chunks` list until it exits.
+
+    Process is waited for by a background thread, which wakes up the reader
+    through a pipe. So the reader blocks without polling, and children left
+    running with the same stdout don't keep it waiting once the process
+    itself has exited.
+    """
+    def __init__(self, process):
+        self.process = process
+        self.chunks = []
+        self.output_open = True
+        self.exited, self.exited_writer = os.pipe()
+        self.thread = threading.Thread(target=self._wait)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _wait(self):
+        self.process.wait()
+        os.write(self.exited_writer, 'x')
+
+    def _read_chunk(self, fd):
+        chunk = os.read(fd, COPY_CHUNK_SIZE)
+        if chunk:
+            self.chunks.append(chunk)
+        else:
+            self.output_open = False
+
+    def read(self, timeout=None):
+        """Read output until the process exits, waiting at most `timeout`
+        seconds if given.
+
+        Return True if the process has exited, False on timeout.
+        """
+        fd = self.process.stdout.fileno()
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            wait = None
+            if timeout is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    return False
+
+            fds = [self.exited]
+            if self.output_open:
+                fds.append(fd)
+            try:
+                ready = select.select(fds, [], [], wait)[0]
+                if fd in ready:
+                    self._read_chunk(fd)
+                if self.exited in ready:
+                    # Take output which is already there, but don't wait
+                    # for its end.
+                    while self.output_open and \
+                              select.select([fd], [], [], 0)[0]:
+                        self._read_chunk(fd)
+                    self.thread.join()
+                    return True
+            except (select.error, OSError), e:
+                # Interrupted by a signal, try again.
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def close(self):
+        """Close the wake up pipe. Process must have exited by then.
+        """
+        os.close(self.exited)
+        os.close(self.exited_writer)
+
+def run_cmd(cmd, env=None, max_timeout=None, cwd=None, limits=None):
     """Run command and return its return code and its output.
 
+    Command is run in `cwd` directory if given, current directory otherwise.
+    Resource `limits` are applied to the command (see `set_limits`).
+
+    If command doesn't exit in `max_timeout` seconds, it's interrupted,
+    and killed if it doesn't exit soon after that.
+
     >>> run_cmd('/bin/true')
     (0, '')
 
@@ -30,33 +147,37 @@ def run_cmd(cmd, env=None, max_timeout=None):
     (1, 'Time exceeded')
     """
     arglist = cmd.split()
-    output, output_name = make_temp_file()
+
+    if limits:
+        preexec_fn = lambda: set_limits(limits)
+    else:
+        preexec_fn = None
 
     try:
-        try:
-            p = Popen(arglist, stdout=output, stderr=STDOUT, env=env)
+        p = Popen(arglist, stdout=PIPE, stderr=STDOUT, env=env,
+                  cwd=cwd, preexec_fn=preexec_fn)
+    except Exception, e:
+        return 1, e
 
+    reader = OutputReader(p)
+    try:
+        try:
             # Wait only max_timeout seconds.
-            if max_timeout:
-                start = time.time()
-                while p.poll() is None:
-                    time.sleep(0.1)
-                    if time.time() - start > max_timeout:
-                        os.kill(p.pid, signal.SIGINT)
-                        p.wait()
-                        return 1, "Time exceeded"
+            if not reader.read(max_timeout or None):
+                os.kill(p.pid, signal.SIGINT)
+                if not reader.read(KILL_TIMEOUT):
+                    os.kill(p.pid, signal.SIGKILL)
+                    reader.read()
+                return 1, "Time exceeded"
 
-            p.wait()
-            output.seek(0)
-
-            output_content = output.read()
-
-            return p.returncode, output_content
+            return p.returncode, ''.join(reader.chunks)
         except Exception, e:
             return 1, e
     finally:
-        output.close()
-        os.unlink(output_name)
+        p.stdout.close()
+        # Reader thread is gone only when the process has exited.
+        if not reader.thread.isAlive():
+            reader.close()
 
 def command_successful(cmd):
     """Returns True if command exited normally, False otherwise.
@@ -163,9 +284,67 @@ def pad_line(char="=", length=(PAD_TEXT+PAD_VALUE+1)):
     """
     return char * length
 
-def unzip_package(package, destination):
+def is_safe_member_name(name):
+    """Check if archive member `name` stays inside the directory archive is
+    extracted to.
+
+    >>> is_safe_member_name('pkg/setup.py')
+    True
+    >>> is_safe_member_name('pkg/../../etc/passwd')
+    False
+    >>> is_safe_member_name('/etc/passwd')
+    False
+    """
+    path = os.path.normpath(name)
+    return not (os.path.isabs(path) or path == os.pardir or
+                path.startswith(os.pardir + os.path.sep))
+
+def member_path(destination, name):
+    """Return path of archive member `name` extracted to `destination`.
+
+    Return None if the member would end up outside of destination.
+
+    >>> member_path('/tmp/sandbox', 'pkg/setup.py')
+    '/tmp/sandbox/pkg/setup.py'
+    >>> member_path('/tmp/sandbox', '../../etc/passwd')
+    """
+    if not is_safe_member_name(name):
+        return None
+    return os.path.normpath(os.path.join(destination, name))
+
+def resolves_inside(directory, path):
+    """Check if `path` is inside `directory` once symbolic links in it are
+    resolved. `directory` must already be a real path.
+
+    >>> resolves_inside('/tmp', '/tmp/sandbox/../file')
+    True
+    >>> resolves_inside('/tmp/sandbox', '/tmp/sandbox/..')
+    False
+    """
+    path = os.path.realpath(path)
+    return path == directory or path.startswith(directory + os.path.sep)
+
+def create_placeholder(path, size):
+    """Create file of given size at `path` without writing its contents.
+
+    On most file systems the file will be sparse.
+    """
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    placeholder = open(path, 'wb')
+    placeholder.truncate(size)
+    placeholder.close()
+
+def unzip_package(package, destination, skip=None, stats=None):
     """Unzip given `package` to the `destination` directory.
 
+    If `skip` is given, it's called with name and size of each file. For
+    files it returns True for, only an empty placeholder of the same size
+    is created. Members which would be extracted outside of destination are
+    skipped as well. If `stats` dictionary is given, number of bytes
+    written and skipped is added to its 'written' and 'skipped' values.
+
     Return name of unpacked directory or None on error.
     """
     try:
@@ -173,27 +352,62 @@ def unzip_package(package, destination):
     except zipfile.error:
         return None
 
-    # Get directory structure from zip and create it in destination directory.
-    for name in z.namelist():
+    unpack_dir = None
+    written = skipped = 0
+
+    # Create directories and extract files in a single pass. Files are
+    #     copied in chunks, so memory use doesn't depend on their size.
+    for info in z.infolist():
+        name = info.filename
+        if not is_safe_member_name(name):
+            if not name.endswith('/'):
+                skipped += info.file_size
+            continue
+
         (dir, file) = os.path.split(name)
         unpack_dir = dir
         target_dir = os.path.join(destination, dir)
         if not os.path.exists(target_dir):
             os.makedirs(target_dir)
 
-    # Extract files to directory structure
-    for i, name in enumerate(z.namelist()):
-        if not name.endswith('/'):
-            outfile = open(os.path.join(destination, name), 'wb')
-            outfile.write(z.read(name))
-            outfile.flush()
-            outfile.close()
+        if name.endswith('/'):
+            continue
+
+        path = os.path.join(destination, name)
+        if skip is not None and skip(name, info.file_size):
+            create_placeholder(path, info.file_size)
+            skipped += info.file_size
+        else:
+            infile = z.open(info)
+            outfile = open(path, 'wb')
+            try:
+                shutil.copyfileobj(infile, outfile, COPY_CHUNK_SIZE)
+            finally:
+                outfile.close()
+                infile.close()
+            written += info.file_size
+
+    z.close()
+
+    if unpack_dir is None:
+        return None
+
+    if stats is not None:
+        stats['written'] += written
+        stats['skipped'] += skipped
 
     return unpack_dir.split("/")[0]
 
-def untar_package(package, destination):
+def untar_package(package, destination, skip=None, stats=None):
     """Untar given `package` to the `destination` directory.
 
+    Members are extracted while reading the archive, in a single pass.
+    See unzip_package for description of `skip` and `stats`. Besides
+    members which would be extracted outside of destination, links
+    pointing outside of it and device files are also skipped. Paths are
+    checked with links extracted so far resolved, so a chain of links
+    can't lead outside either.
+
     Return name of unpacked directory or None on error.
     """
     try:
@@ -201,21 +415,56 @@ def untar_package(package, destination):
     except tarfile.ReadError, e:
         return None
 
-    for member in t.getmembers():
-        t.extract(member, destination)
+    unpack_dir = None
+    written = skipped = 0
+    real_destination = os.path.realpath(destination)
+
+    for member in t:
+        ## GG: os.sep is \\ when running cheesecake on Windows
+        ## while inside the tar.gz the separator is /
+        ## We use / because most tar.gz archives are created on *nix
+        ##unpack_dir = member.name.split(os.sep)[0]
+        if unpack_dir is None:
+            unpack_dir = member.name.split('/')[0]
+
+        path = member_path(destination, member.name)
+        if member.issym():
+            target = os.path.join(os.path.dirname(member.name),
+                                  member.linkname)
+        elif member.islnk():
+            target = member.linkname
+        else:
+            target = member.name
+
+        if path is None or member_path(destination, target) is None or \
+               member.isdev() or \
+               not resolves_inside(real_destination, os.path.dirname(path)) or \
+               not resolves_inside(real_destination,
+                                   os.path.join(destination, target)):
+            skipped += member.size
+        elif member.isfile() and skip is not None and \
+                 skip(member.name, member.size):
+            create_placeholder(path, member.size)
+            skipped += member.size
+        else:
+            t.extract(member, destination)
+            if member.isfile():
+                written += member.size
 
-    tarinfo = t.members[0]
     t.close()
 
-    ## GG: os.sep is \\ when running cheesecake on Windows
-    ## while inside the tar.gz the separator is /
-    ## We use / because most tar.gz archives are created on *nix
-    ##return tarinfo.name.split(os.sep)[0]
-    return tarinfo.name.split('/')[0]
+    if stats is not None:
+        stats['written'] += written
+        stats['skipped'] += skipped
 
-def unegg_package(package, destination):
+    return unpack_dir
+
+def unegg_package(package, destination, skip=None, stats=None):
     """Unpack given egg to the `destination` directory.
 
+    See unzip_package for description of `skip` and `stats`, which are
+    only used for zipped eggs.
+
     Return name of unpacked directory or None on error.
     """
     if os.path.isdir(package):
@@ -224,7 +473,186 @@ def unegg_package(package, destination):
         shutil.copytree(package, destination, symlinks=True)
         return package_name
     else:
-        return unzip_package(package, destination)
+        return unzip_package(package, destination, skip, stats)
+
+class PackageContents(object):
+    """Listing of a package archive, along with sources of its Python
+    modules, read without extracting the archive.
+
+    Member names use '/' as a separator, as they do in archives.
+    """
+    def __init__(self):
+        self.unpack_dir = None
+        self.files = []
+        self.dirs = []
+        self.sources = {}
+
+    def add_file(self, name, size, read=None):
+        """Add file member of given size.
+
+        `read` is called to get contents of Python modules.
+        """
+        self.files.append((name, size))
+        if read is not None and name.lower().endswith('.py'):
+            try:
+                self.sources[name] = read()
+            except (IOError, KeyError):
+                # Broken link inside the archive.
+                pass
+
+    def add_dir(self, name):
+        """Add directory member.
+        """
+        self.dirs.append(name.rstrip('/'))
+
+    def listing(self):
+        """Return files and directories below `unpack_dir`, as they would
+        be seen in the extracted package.
+
+        Return (files, dirs, empty, sources) tuple. Files and directories
+        are lists of paths relative to `unpack_dir`, empty is a set of
+        empty files and directories and sources maps relative paths of
+        Python modules to their contents.
+
+        >>> contents = PackageContents()
+        >>> contents.unpack_dir = 'pkg'
+        >>> contents.add_dir('pkg/')
+        >>> contents.add_dir('pkg/doc/')
+        >>> contents.add_file('pkg/README', 0)
+        >>> contents.add_file('pkg/lib/mod.py', 5, lambda: 'pass\\n')
+        >>> files, dirs, empty, sources = contents.listing()
+        >>> files, dirs
+        (['README', 'lib/mod.py'], ['lib', 'doc'])
+        >>> sorted(empty)
+        ['README', 'doc']
+        >>> sources
+        {'lib/mod.py': 'pass\\n'}
+        """
+        prefix = self.unpack_dir + '/'
+
+        def relative(name):
+            if name.startswith(prefix) and name != prefix:
+                return name[len(prefix):].replace('/', os.path.sep)
+            return None
+
+        files = []
+        sizes = {}
+        dirs = []
+        nonempty_dirs = set()
+
+        def add_parents(name):
+            parent = os.path.dirname(name)
+            while parent:
+                if parent not in nonempty_dirs:
+                    nonempty_dirs.add(parent)
+                    if parent not in dirs:
+                        dirs.append(parent)
+                parent = os.path.dirname(parent)
+
+        for name, size in self.files:
+            name = relative(name)
+            if name is None:
+                continue
+            if name not in sizes:
+                files.append(name)
+            # Later members overwrite earlier ones during extraction.
+            sizes[name] = size
+            add_parents(name)
+
+        for name in self.dirs:
+            name = relative(name)
+            if name is None:
+                continue
+            if name not in dirs:
+                dirs.append(name)
+            add_parents(name)
+
+        empty = set()
+        for name in files:
+            if sizes[name] == 0:
+                empty.add(name)
+        for name in dirs:
+            if name not in nonempty_dirs:
+                empty.add(name)
+
+        sources = {}
+        for name, source in self.sources.iteritems():
+            name = relative(name)
+            if name is not None:
+                sources[name] = source
+
+        return files, dirs, empty, sources
+
+def read_zip_package(package):
+    """Read contents of given zip `package` without extracting it.
+
+    Return PackageContents instance or None on error.
+    """
+    try:
+        z = zipfile.ZipFile(package)
+    except zipfile.error:
+        return None
+
+    contents = PackageContents()
+    names = filter(is_safe_member_name, z.namelist())
+    for info in z.infolist():
+        if not is_safe_member_name(info.filename):
+            continue
+        if info.filename.endswith('/'):
+            contents.add_dir(info.filename)
+        else:
+            contents.add_file(info.filename, info.file_size,
+                              lambda: z.read(info.filename))
+
+    if not names:
+        return None
+
+    # Same as unzip_package: top directory of the last member.
+    (dir, file) = os.path.split(names[-1])
+    contents.unpack_dir = dir.split("/")[0]
+    z.close()
+
+    return contents
+
+def read_tar_package(package):
+    """Read contents of given tar `package` without extracting it.
+
+    Return PackageContents instance or None on error.
+    """
+    try:
+        t = tarfile.open(package)
+    except tarfile.ReadError, e:
+        return None
+
+    contents = PackageContents()
+    for member in t:
+        # Same as untar_package: top directory of the first member.
+        if contents.unpack_dir is None:
+            contents.unpack_dir = member.name.split('/')[0]
+
+        if not is_safe_member_name(member.name):
+            continue
+        if member.isdir():
+            contents.add_dir(member.name)
+        elif member.isfile() or member.issym() or member.islnk():
+            contents.add_file(member.name, member.size,
+                              lambda: t.extractfile(member).read())
+        else:
+            # Devices and fifos can't be read.
+            contents.add_file(member.name, member.size)
+    t.close()
+
+    if contents.unpack_dir is None:
+        return None
+
+    return contents
+
+def read_egg_package(package):
+    """Read contents of given egg without extracting it.
+
+    Return PackageContents instance or None on error.
+    """
+    return read_zip_package(package)
 
 def mkdirs(dir):
     """Make directory with parent directories as needed.
@@ -271,3 +699,410 @@ def rmtree(topdir):
 
     shutil.rmtree(topdir, ignore_errors=True)
 
+def hash_key(*parts):
+    """Return SHA-1 hex digest of given strings.
+
+    >>> hash_key('cheesecake', '0.6.2')
+    '9cde068b34cc30c5d37056769793b1043003974a'
+    >>> hash_key('cheesecake', '0.6.2') == hash_key('cheesecake', '0.6.3')
+    False
+    """
+    digest = sha1()
+    for part in parts:
+        # Prefix each part with its length, so that ('ab', 'c') and
+        # ('a', 'bc') give different keys.
+        digest.update('%d:%s' % (len(part), part))
+    return digest.hexdigest()
+
+def hash_file(path):
+    """Return SHA-1 hex digest of contents of file at `path`.
+    """
+    digest = sha1()
+    fd = open(path, 'rb')
+    try:
+        while True:
+            chunk = fd.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    finally:
+        fd.close()
+    return digest.hexdigest()
+
+class DiskCache(object):
+    """Persistent cache of picklable values, stored in a directory.
+
+    Keys should be file name safe strings, like those returned by `hash_key`.
+    Writes are atomic, so many processes may share one cache directory.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Other process may have created it in the meantime.
+                if not os.path.isdir(directory):
+                    raise
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key, default=None):
+        """Return value stored under `key` or `default` if there isn't one.
+        """
+        try:
+            fd = open(self._path(key), 'rb')
+        except IOError:
+            return default
+
+        try:
+            try:
+                return pickle.load(fd)
+            except Exception:
+                # Treat corrupted entries as missing.
+                return default
+        finally:
+            fd.close()
+
+    def set(self, key, value):
+        """Store `value` under `key`.
+        """
+        fd, tmpname = tempfile.mkstemp(prefix='.', dir=self.directory)
+        tmp = os.fdopen(fd, 'wb')
+        try:
+            pickle.dump(value, tmp, pickle.HIGHEST_PROTOCOL)
+        finally:
+            tmp.close()
+        os.rename(tmpname, self._path(key))
+
+    def delete(self, key):
+        """Remove value stored under `key`, if there is one.
+        """
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def keys(self):
+        """Return list of keys which have values stored.
+        """
+        # Temporary files of sets in progress start with a dot.
+        return [name for name in os.listdir(self.directory)
+                if not name.startswith('.')]
+
+class ArtifactCache(object):
+    """Content-addressed store of downloaded package files.
+
+    Each distinct file is stored once, under SHA-1 digest of its contents,
+    and is looked up by keys (like `hash_key` of its URL), along with
+    picklable metadata. When total size of stored files exceeds `max_size`
+    bytes, least recently used ones are removed, along with keys referring
+    to them.
+    """
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.refs = DiskCache(os.path.join(directory, 'refs'))
+        self.objects = os.path.join(directory, 'objects')
+        if not os.path.isdir(self.objects):
+            try:
+                os.makedirs(self.objects)
+            except OSError:
+                # Other process may have created it in the meantime.
+                if not os.path.isdir(self.objects):
+                    raise
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest)
+
+    def get(self, key, destination, max_age=None):
+        """Put file stored under `key` into `destination` directory.
+
+        If `max_age` is given, file stored under `key` more than that many
+        seconds ago is treated as missing.
+
+        Return (path, metadata) tuple, or None if there's no such file.
+        """
+        ref = self.refs.get(key)
+        if ref is None:
+            return None
+
+        try:
+            digest, filename, metadata, stored = ref
+        except ValueError:
+            # Stored by an older version, which didn't keep time.
+            return None
+        if max_age is not None and time.time() - stored > max_age:
+            return None
+
+        source = self._object_path(digest)
+        path = os.path.join(destination, filename)
+        try:
+            # Mark file as recently used.
+            os.utime(source, None)
+            try:
+                # Hard link is enough, as package files are never modified.
+                os.link(source, path)
+            except OSError:
+                shutil.copyfile(source, path)
+        except (IOError, OSError):
+            # File has been evicted.
+            self.refs.delete(key)
+            return None
+
+        return path, metadata
+
+    def put(self, key, path, metadata=None):
+        """Store file at `path` under `key`, along with its `metadata`.
+        """
+        digest = sha1()
+        fd, tmpname = tempfile.mkstemp(prefix='.', dir=self.objects)
+        tmp = os.fdopen(fd, 'wb')
+        source = open(path, 'rb')
+        try:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+        finally:
+            source.close()
+            tmp.close()
+
+        digest = digest.hexdigest()
+        os.rename(tmpname, self._object_path(digest))
+
+        self.refs.set(key, (digest, os.path.basename(path), metadata,
+                            time.time()))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used files until they fit in `max_size`.
+        """
+        files = []
+        total_size = 0
+        for name in os.listdir(self.objects):
+            if name.startswith('.'):
+                # Temporary file of a put in progress.
+                continue
+            path = os.path.join(self.objects, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total_size += st.st_size
+
+        files.sort()
+        evicted = set()
+        for mtime, size, path in files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            evicted.add(os.path.basename(path))
+            total_size -= size
+
+        if evicted:
+            for key in self.refs.keys():
+                ref = self.refs.get(key)
+                if ref is not None and ref[0] in evicted:
+                    self.refs.delete(key)
+
+class InstallRootPool(object):
+    """Directories for test installations of packages, reused between
+    packages instead of being created and removed for each of them.
+
+    Every directory found in the pool `directory` which isn't checked out
+    is available, so directories left by earlier runs (or by other
+    processes using the same pool one after another) are reused as well.
+    Directory is emptied when it's checked out, so every package is
+    installed into a clean one. Nothing is prepared in the directories ahead
+    of time; only the directories themselves are reused.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or tempfile.mkdtemp(prefix='cheesecake')
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.busy = set()
+        self.lock = threading.Lock()
+
+    def checkout(self):
+        """Return path of an empty install directory.
+        """
+        self.lock.acquire()
+        try:
+            for name in sorted(os.listdir(self.directory)):
+                path = os.path.join(self.directory, name)
+                if path not in self.busy and os.path.isdir(path):
+                    break
+            else:
+                path = tempfile.mkdtemp(prefix='install', dir=self.directory)
+            self.busy.add(path)
+        finally:
+            self.lock.release()
+
+        for name in os.listdir(path):
+            entry = os.path.join(path, name)
+            if os.path.isdir(entry) and not os.path.islink(entry):
+                rmtree(entry)
+            else:
+                os.unlink(entry)
+
+        return path
+
+    def checkin(self, path):
+        """Give back directory returned by `checkout`, so that it can be
+        reused. Paths which don't come from this pool are ignored.
+        """
+        self.lock.acquire()
+        try:
+            self.busy.discard(path)
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Remove all directories of the pool.
+        """
+        if os.path.isdir(self.directory):
+            rmtree(self.directory)
+
+class ThreadCall(object):
+    """Call function in a separate thread.
+
+    Use `result` to wait for the function to finish and get its return
+    value. Exception raised by the function is reraised by `result`.
+
+    >>> call = ThreadCall(lambda: 6*7)
+    >>> call.result()
+    42
+    """
+    def __init__(self, function):
+        self.function = function
+        self.value = None
+        self.exc_info = None
+
+        self.thread = threading.Thread(target=self._run)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            self.value = self.function()
+        except:
+            self.exc_info = sys.exc_info()
+
+    def result(self):
+        self.thread.join()
+        if self.exc_info:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.value
+
+def thread_map(function, items, jobs):
+    """Return map(function, items), calling function from up to `jobs`
+    threads at once.
+
+    Results are in the same order as items. If function raises an
+    exception, it is reraised after all threads have finished.
+
+    >>> thread_map(lambda x: x*2, [1, 2, 3], 2)
+    [2, 4, 6]
+    """
+    items = list(items)
+    results = [None] * len(items)
+    pending = iter(enumerate(items))
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            lock.acquire()
+            try:
+                try:
+                    i, item = pending.next()
+                except StopIteration:
+                    return
+            finally:
+                lock.release()
+            results[i] = function(item)
+
+    if jobs <= 1:
+        work()
+    else:
+        calls = [ThreadCall(work) for x in xrange(min(jobs, len(items)))]
+        for call in calls:
+            call.result()
+
+    return results
+
+class ProcessCallError(Exception):
+    """Exception raised in a process run by ProcessCall.
+    """
+
+class ProcessCall(object):
+    """Call function in a forked process.
+
+    Function return value has to be picklable. Since it's the only thing
+    that gets back to the caller, side effects of the function are lost.
+    Exception raised by the function is reraised by `result` as
+    ProcessCallError.
+
+    >>> call = ProcessCall(lambda: 6*7)
+    >>> call.result()
+    42
+    """
+    def __init__(self, function):
+        self.function = function
+        self.connection, child_connection = multiprocessing.Pipe(False)
+
+        # Don't let the child write out data buffered by the parent.
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        self.process = multiprocessing.Process(target=self._run,
+                                               args=(child_connection,))
+        self.process.start()
+        # Parent doesn't need this end, and closing it lets `result` notice
+        # a child that died without sending anything.
+        child_connection.close()
+
+    def _run(self, connection):
+        try:
+            result = (True, self.function())
+        except:
+            result = (False, traceback.format_exc())
+        connection.send(result)
+        connection.close()
+
+    def result(self):
+        try:
+            success, value = self.connection.recv()
+        except EOFError:
+            success, value = False, "process died unexpectedly"
+        self.connection.close()
+        self.process.join()
+
+        if not success:
+            raise ProcessCallError(value)
+        return value
+
+def first_finished(calls):
+    """Wait until any of ProcessCall instances in `calls` is done and return
+    it. Its `result` won't block then.
+
+    >>> slow = ProcessCall(lambda: time.sleep(5))
+    >>> fast = ProcessCall(lambda: 42)
+    >>> first_finished([slow, fast]) is fast
+    True
+    >>> fast.result()
+    42
+    >>> slow.process.terminate()
+    >>> slow.process.join()
+    """
+    ready = select.select([call.connection for call in calls], [], [])[0]
+    for call in calls:
+        if call.connection in ready:
+            return call
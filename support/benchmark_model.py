@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Measure memory footprint of the code model built for all Python modules
+# in a directory (by default the standard library).
+#
+
+import os
+import resource
+import sys
+import time
+
+from argparse import ArgumentParser
+
+current_dir = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(current_dir, '../'))
+
+from cheesecake.model import Documentable, System, parseFile, processModuleAst
+
+
+def find_modules(directory):
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.py'):
+                yield os.path.join(root, name)
+
+
+def slot_names(cls):
+    names = []
+    for klass in cls.__mro__:
+        names.extend(klass.__dict__.get('__slots__', ()))
+    return names
+
+
+def object_size(obj, seen):
+    """Return size in bytes of `obj` and containers it owns, not counting
+    anything already in `seen`.
+    """
+    size = 0
+    values = [obj]
+    if hasattr(obj, '__dict__'):
+        values.append(obj.__dict__)
+        values.extend(obj.__dict__.values())
+    else:
+        values.extend([getattr(obj, name) for name in slot_names(type(obj))
+                       if hasattr(obj, name)])
+    for name in ['contents', 'orderedcontents', '_name2fullname', 'bases',
+                 'rawbases', 'baseobjects', 'subclasses']:
+        values.append(getattr(obj, name, None))
+    values.extend([obj.prefix, obj.name, obj.fullName()])
+    for value in values:
+        if value is None or id(value) in seen:
+            continue
+        if isinstance(value, Documentable) and value is not obj:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+    return size
+
+
+def main():
+    parser = ArgumentParser(description="Measure memory used by the code "
+                            "model of parsed Python modules.")
+    parser.add_argument('directory', nargs='?',
+                        default=os.path.dirname(os.__file__),
+                        help="directory with Python modules to parse "
+                        "(default: %(default)s)")
+    parser.add_argument('--fullname-calls', type=int, default=10,
+                        help="number of fullName() calls per object to time "
+                        "(default: %(default)s)")
+    args = parser.parse_args()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    systems = []
+    for path in find_modules(args.directory):
+        system = System()
+        try:
+            ast = parseFile(path)
+            processModuleAst(ast, os.path.splitext(os.path.basename(path))[0],
+                             system)
+        except Exception:
+            # CodeParser skips modules it can't process as well.
+            continue
+        # Keep only the model, like the cached CodeParser results do.
+        del ast
+        systems.append(system)
+    parse_time = time.time() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    objects = [obj for system in systems
+               for obj in system.orderedallobjects]
+    seen = set()
+    model_size = sum(object_size(obj, seen) for obj in objects)
+
+    start = time.time()
+    for obj in objects:
+        for i in xrange(args.fullname_calls):
+            obj.fullName()
+    fullname_time = time.time() - start
+
+    print("modules parsed:       %d" % len(systems))
+    print("objects:              %d" % len(objects))
+    print("model size:           %.1f MB (%d bytes per object)" %
+          (model_size / 1048576.0, model_size / max(len(objects), 1)))
+    print("peak RSS growth:      %.1f MB" % ((rss_after - rss_before) / 1024.0))
+    print("parse time:           %.2f s" % parse_time)
+    print("fullName() calls:     %.3f s" % fullname_time)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Compare the ast based code model extraction with the old one, built on
+# the compiler package, for all Python modules in a directory (by default
+# the standard library). Reports time taken by both and any differences
+# in extracted data.
+#
+# Expected differences are:
+#  * line numbers of decorated functions and classes, which ast puts at
+#    the first decorator,
+#  * default values that ast_pp couldn't write out (like lists, lambdas
+#    and most operators),
+#  * string literals in modules using unicode_literals, which the compiler
+#    package ignores.
+#
+
+import os
+import sys
+import time
+
+from argparse import ArgumentParser
+
+current_dir = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(current_dir, '../'))
+
+from cheesecake import compiler_model, model
+
+
+def find_modules(directory):
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith('.py'):
+                yield os.path.join(root, name)
+
+
+def describe(system):
+    """Return data extracted for each object in `system`, as a dictionary
+    mapping field names to lists of values.
+    """
+    fields = {'func_called': [sorted(system.func_called)]}
+    for obj in system.orderedallobjects:
+        values = [
+            ('objects', (obj.kind, obj.fullName())),
+            ('docstrings', obj.docstring),
+            ('names', sorted(obj._name2fullname.items())),
+            ('linenumbers', getattr(obj, 'linenumber', None)),
+            ]
+        if isinstance(obj, model.Class):
+            values.extend([('bases', obj.bases), ('rawbases', obj.rawbases)])
+        if isinstance(obj, model.Function):
+            values.append(('argspec', obj.argspec))
+        for field, value in values:
+            fields.setdefault(field, []).append(value)
+    return fields
+
+
+def extract(module, path):
+    """Parse module at `path` and extract its model, using parse functions
+    from `module`. Return (system, parse_time, extract_time) tuple.
+    """
+    start = time.time()
+    tree = module.parseFile(path)
+    parsed = time.time()
+    system = model.System()
+    module.processModuleAst(tree,
+                            os.path.splitext(os.path.basename(path))[0],
+                            system)
+    return system, parsed - start, time.time() - parsed
+
+
+def main():
+    parser = ArgumentParser(description="Compare code model extraction "
+                            "from ast and compiler syntax trees.")
+    parser.add_argument('directory', nargs='?',
+                        default=os.path.dirname(os.__file__),
+                        help="directory with Python modules to parse "
+                        "(default: %(default)s)")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="print every difference found")
+    args = parser.parse_args()
+
+    times = {}
+    differences = {}
+    modules = 0
+    for path in find_modules(args.directory):
+        results = []
+        for module in [compiler_model, model]:
+            try:
+                system, parse_time, extract_time = extract(module, path)
+            except Exception:
+                # CodeParser skips modules it can't process as well.
+                break
+            results.append(describe(system))
+            total = times.setdefault(module.__name__, [0, 0])
+            total[0] += parse_time
+            total[1] += extract_time
+        if len(results) != 2:
+            continue
+        modules += 1
+        old, new = results
+        for field in sorted(set(old) | set(new)):
+            if old.get(field) != new.get(field):
+                differences[field] = differences.get(field, 0) + 1
+                if args.verbose:
+                    print("%s: %s differ" % (path, field))
+
+    print("modules compared:     %d" % modules)
+    for name in sorted(times):
+        print("%-21s parse %.2f s, extract %.2f s" %
+              (name + ':', times[name][0], times[name][1]))
+    for field in sorted(differences):
+        print("modules with different %s: %d" % (field, differences[field]))
+    if not differences:
+        print("no differences found")
+
+
+if __name__ == '__main__':
+    main()
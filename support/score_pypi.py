@@ -5,12 +5,17 @@
 #
 
 import datetime
+import json
+import multiprocessing
 import os
 import re
 import sys
 import time
+import traceback
 import urllib2
 
+from argparse import ArgumentParser
+
 current_dir = os.path.dirname(__file__)
 sys.path.insert(0, os.path.join(current_dir, '../'))
 
@@ -19,11 +24,15 @@ try:
 except ImportError, ex:
     from cheesecake import subprocess
 
+from cheesecake import cheesecake_index
+
 
 CHEESECAKE_PATH = os.path.abspath(os.path.join(current_dir,
                                                '../cheesecake_index'))
 
 LOG_PATH = '/tmp/cheesecake_pypi_results'
+SANDBOX_PATH = '/tmp/cheesecake_pypi_sandbox'
+RESULTS_PATH = os.path.join(LOG_PATH, 'results.jsonl')
 
 
 def read_file_contents(filename):
@@ -35,6 +44,12 @@ def read_file_contents(filename):
     return contents
 
 
+def write_file_contents(filename, contents):
+    fd = file(filename, 'w')
+    fd.write(contents)
+    fd.close()
+
+
 def replace_chars(string):
     replacements = {'%20': '_',
                     '%27': "\\'",
@@ -71,21 +86,30 @@ def get_package_names():
             yield (replace_chars(m.group(1)), replace_chars(m.group(2)))
 
 
-def score_one_package(package_name, log_template):
+def score_one_package(package_name, log_template, sandbox=None):
     """Score one package leaving information in logs along the way.
 
+    If `sandbox` is given, Cheesecake will unpack the package there
+    instead of in a random temporary directory.
+
     :Logs:
       * .stdout -> Cheesecake stdout
       * .stderr -> Cheesecake stderr
       * .log -> Cheesecake log for given package
+
+    Return (score, indices) tuple, where `indices` maps names of all indices
+    printed by Cheesecake to their values. Score is -1 on failure.
     """
     log_file = log_template % 'log'
 
     stdout_fd = file(log_template % 'stdout', 'w')
     stderr_fd = file(log_template % 'stderr', 'w')
 
-    process = subprocess.Popen('%s -l %s -n %s' %
-                               (CHEESECAKE_PATH, log_file, package_name),
+    command = '%s -l %s -n %s' % (CHEESECAKE_PATH, log_file, package_name)
+    if sandbox:
+        command += ' -s %s' % sandbox
+
+    process = subprocess.Popen(command,
                                stdout=stdout_fd,
                                stderr=stderr_fd,
                                shell=True)
@@ -100,9 +124,50 @@ def score_one_package(package_name, log_template):
         stdout = read_file_contents(log_template % 'stdout')
         m = re.search(score_regex, stdout)
         if m:
-            return int(m.group(1))
+            return int(m.group(1)), read_index_values(stdout)
+
+    return -1, {}
+
+
+def read_index_values(stdout):
+    """Get values of all indices from Cheesecake output.
+
+    >>> values = read_index_values("unpack ....... 25  (package unpacked)\\n"
+    ...                            "DOCUMENTATION INDEX (ABSOLUTE) .. 120\\n")
+    >>> values == {'unpack': 25, 'DOCUMENTATION INDEX (ABSOLUTE)': 120}
+    True
+    """
+    index_regex = r'^(\S.*?) \.+\s+(-?\d+)'
+    values = {}
+    for line in stdout.splitlines():
+        m = re.search(index_regex, line)
+        if m:
+            values[m.group(1)] = int(m.group(2))
+    return values
+
+
+def score_package_in_process(package_name, log_template, sandbox=None):
+    """Score one package using Cheesecake API instead of the script.
 
-    return -1
+    Saves interpreter startup and parsing of Cheesecake output for every
+    package. Return value is the same as for `score_one_package`.
+    """
+    # Package names are escaped for the shell by replace_chars().
+    package_name = package_name.replace('\\', '')
+
+    try:
+        index = cheesecake_index.score_package(name=package_name,
+                                               logfile=log_template % 'log',
+                                               sandbox=sandbox)
+    except cheesecake_index.CheesecakeError, e:
+        write_file_contents(log_template % 'stderr', str(e))
+        return -1, {}
+    except Exception, e:
+        write_file_contents(log_template % 'stderr', traceback.format_exc())
+        return -1, {}
+
+    return ((index.value * 100) / index.max_value,
+            cheesecake_index.index_values(index))
 
 
 def time2datetime(t):
@@ -115,25 +180,162 @@ def time_delta(start, end):
     return str(time2datetime(end) - time2datetime(start))
 
 
-def score_all_packages():
+class ResultsStore(object):
+    """Append-only JSON lines file with results of scored packages.
+
+    Each result is written and flushed as soon as it's added, so an
+    interrupted run can be restarted and skip packages it already scored.
+    Packages which failed to score are in the store as well, with score -1,
+    so they are skipped too unless `failed` is checked. Result added later
+    replaces the earlier one for the same package.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.results = {}
+
+        if os.path.exists(filename):
+            for line in file(filename):
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # Last line may be truncated if previous run crashed.
+                    continue
+                # JSON gives back unicode, package names are UTF-8 strings.
+                key = (result['name'].encode('utf-8'),
+                       result['version'].encode('utf-8'))
+                self.results[key] = result
+
+        self.fd = file(filename, 'a+')
+        # Don't glue the first new result to a line truncated by a crash.
+        self.fd.seek(0, os.SEEK_END)
+        if self.fd.tell() > 0:
+            self.fd.seek(-1, os.SEEK_END)
+            if self.fd.read(1) != '\n':
+                self.fd.seek(0, os.SEEK_END)
+                self.fd.write('\n')
+
+    def __contains__(self, name_and_version_pair):
+        return tuple(name_and_version_pair) in self.results
+
+    def failed(self, name_and_version_pair):
+        """Return True if package is in the store, but failed to score.
+        """
+        result = self.results.get(tuple(name_and_version_pair))
+        return result is not None and result['score'] == -1
+
+    def add(self, result):
+        """Store result dictionary and commit it to disk.
+        """
+        self.results[(result['name'], result['version'])] = result
+
+        self.fd.write(json.dumps(result) + '\n')
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+
+    def items(self):
+        """Return list of ((name, version), result) pairs.
+        """
+        return self.results.items()
+
+    def close(self):
+        self.fd.close()
+
+
+def score_package_task(name_and_version_pair,
+                       score_function=score_one_package):
+    """Score a single (name, version) pair with given `score_function`.
+
+    This is the unit of work handed to pool workers, so every package gets
+    its own log template and its own sandbox directory.
+
+    Return result dictionary suitable for `ResultsStore`.
+    """
+    name, version = name_and_version_pair
+    name_and_version = '%s-%s' % (name, version)
+    log_template = os.path.join(LOG_PATH, name_and_version + '.%s')
+    sandbox = os.path.join(SANDBOX_PATH, name_and_version)
+
+    start = time.time()
+    score, indices = score_function('%s==%s' % (name, version),
+                                    log_template,
+                                    sandbox)
+    end = time.time()
+
+    return {'name': name,
+            'version': version,
+            'score': score,
+            'indices': indices,
+            'start': start,
+            'end': end}
+
+
+def score_package_in_process_task(name_and_version_pair):
+    """Score a single (name, version) pair without running Cheesecake script.
+    """
+    return score_package_task(name_and_version_pair, score_package_in_process)
+
+
+def iter_package_scores(packages, jobs=1, in_process=False):
+    """Score given (name, version) pairs and yield results as they finish.
+
+    With `jobs` greater than one packages are scored by a pool of `jobs`
+    worker processes, so results may come in a different order than
+    `packages`. With `in_process` set, packages are scored through Cheesecake
+    API rather than by running cheesecake_index script for each of them.
+    """
+    if in_process:
+        task = score_package_in_process_task
+    else:
+        task = score_package_task
+
+    if jobs <= 1:
+        for package in packages:
+            yield task(package)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap_unordered(task, packages):
+            yield result
+    except:
+        pool.terminate()
+        pool.join()
+        raise
+    pool.close()
+    pool.join()
+
+
+def score_all_packages(jobs=1, results_file=RESULTS_PATH, in_process=False,
+                       retry_failed=False):
     packages_failed = []
     packages_scores = []
 
-    if not os.path.exists(LOG_PATH):
-        os.mkdir(LOG_PATH)
+    for path in [LOG_PATH, SANDBOX_PATH]:
+        if not os.path.exists(path):
+            os.mkdir(path)
+
+    # Packages scored by previous (possibly interrupted) runs are skipped,
+    # including those that failed, unless they are to be retried.
+    store = ResultsStore(results_file)
+    packages = (package for package in get_package_names()
+                if package not in store
+                or (retry_failed and store.failed(package)))
 
-    for name, version in get_package_names():
+    try:
+        for result in iter_package_scores(packages, jobs, in_process):
+            store.add(result)
+    finally:
+        store.close()
+
+    for (name, version), result in store.items():
         name_and_version = '%s-%s' % (name, version)
-        log_template = os.path.join(LOG_PATH, name_and_version + '.%s')
-        start = time.time()
-        result = score_one_package('%s==%s' % (name, version), log_template)
-        end = time.time()
-        if result == -1:
+        if result['score'] == -1:
             packages_failed.append(name_and_version)
         else:
             packages_scores.append((name_and_version,
-                                    result,
-                                    time_delta(start, end)))
+                                    result['score'],
+                                    time_delta(result['start'],
+                                               result['end'])))
 
     print("=== Packages that Cheesecake failed to score ===")
     for failed in packages_failed:
@@ -156,5 +358,41 @@ def score_all_packages():
           len(filter(lambda x: x[1] > 50, packages_scores)))
 
 
+def process_cmdline_args():
+    """Parse command-line arguments.
+    """
+    parser = ArgumentParser()
+    parser.add_argument("-j", "--jobs",
+                        dest="jobs",
+                        type=int,
+                        default=1,
+                        help=("number of packages to score concurrently "
+                              "(default=1)"))
+    parser.add_argument("-r", "--results",
+                        dest="results",
+                        default=RESULTS_PATH,
+                        help=("file where results are stored as they come; "
+                              "packages already there won't be scored again "
+                              "(default=%s)" % RESULTS_PATH))
+    parser.add_argument("--in-process",
+                        action="store_true",
+                        dest="in_process",
+                        default=False,
+                        help=("score packages using Cheesecake API instead of "
+                              "running cheesecake_index for each of them"))
+    parser.add_argument("--retry-failed",
+                        action="store_true",
+                        dest="retry_failed",
+                        default=False,
+                        help=("score again packages which failed in previous "
+                              "runs (by default they are skipped like "
+                              "scored ones)"))
+    return parser.parse_args()
+
+
 if __name__ == '__main__':
-    score_all_packages()
+    arguments = process_cmdline_args()
+    score_all_packages(jobs=arguments.jobs,
+                       results_file=arguments.results,
+                       in_process=arguments.in_process,
+                       retry_failed=arguments.retry_failed)
@@ -39,7 +39,7 @@ def dump_str_to_file(string, filename):
     fd.write(string)
     fd.close()
 
-def mocked_urlretrieve(url, filename):
+def mocked_urlretrieve(url, filename, headers=None):
     if url in VALID_URLS:
         shutil.copy(os.path.join(DATA_PATH, "nose-0.8.3.tar.gz"), filename)
         headers = Mock({'gettype': 'application/x-gzip'})
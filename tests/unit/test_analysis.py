@@ -0,0 +1,177 @@
+import os
+import shutil
+import tempfile
+
+import _path_cheesecake
+from _helper_cheesecake import DATA_PATH, dump_str_to_file
+
+from cheesecake.analysis import AnalysisCache, CallGraph
+from cheesecake.util import DiskCache, rmtree
+
+
+MODULE1_PATH = os.path.join(DATA_PATH, "module1.py")
+
+
+class TestAnalysisCache(object):
+    def setUp(self):
+        self.analysis = AnalysisCache()
+
+    def test_same_source_file(self):
+        source = self.analysis.source_file(MODULE1_PATH)
+        assert MODULE1_PATH in self.analysis
+        assert self.analysis.source_file(MODULE1_PATH) is source
+
+    def test_parsed_once(self):
+        source = self.analysis.source_file(MODULE1_PATH)
+        code = source.code
+        assert source.code is code
+        assert source.ast is source.ast
+        assert code.modules == ["module1"]
+        assert code.object_count() == 21
+
+    def test_lines_and_tokens(self):
+        source = self.analysis.source_file(MODULE1_PATH)
+        assert source.lines == file(MODULE1_PATH).readlines()
+        assert source.tokens[-1][0] == 0  # ENDMARKER
+
+    def test_invalid_source(self):
+        filename = tempfile.mktemp(suffix='.py')
+        dump_str_to_file("def broken(:\n", filename)
+
+        try:
+            source = self.analysis.source_file(filename)
+            assert source.ast is None
+            assert source.code.object_count() == 0
+        finally:
+            os.unlink(filename)
+
+    def test_unreadable_source(self):
+        temp_dir = tempfile.mkdtemp()
+        filename = os.path.join(temp_dir, 'broken.py')
+        os.symlink(os.path.join(temp_dir, 'missing.py'), filename)
+
+        try:
+            source = self.analysis.source_file(filename)
+            assert source.ast is None
+            assert source.tokens is None
+            assert source.code.object_count() == 0
+
+            # Failure is remembered.
+            os.unlink(filename)
+            dump_str_to_file("def function():\n    pass\n", filename)
+            assert source.ast is None
+            assert source.tokens is None
+        finally:
+            rmtree(temp_dir)
+
+
+class TestCallGraph(object):
+    def setUp(self):
+        self.graph = CallGraph()
+        self.graph.update('test_a.py', ['function', 'package.module.function',
+                                        'helper'],
+                          ['package.module.function'])
+        self.graph.update('test_b.py', ['module.Class'])
+
+    def test_reached(self):
+        names = ['module.function', 'module.Class', 'module.other']
+        assert self.graph.reached(['test_a.py', 'test_b.py'], names) == \
+               {'test_a.py': ['module.function'],
+                'test_b.py': ['module.Class']}
+        assert self.graph.reached(['test_b.py'], names) == \
+               {'test_b.py': ['module.Class']}
+
+    def test_suffixes_only_of_imported_names(self):
+        self.graph.update('test_c.py', ['self.module.other'])
+        assert self.graph.reached(['test_c.py'], ['module.other']) == \
+               {'test_c.py': []}
+
+    def test_update_single_file(self):
+        self.graph.update('test_a.py', ['module.other'])
+        assert sorted(self.graph.callers) == \
+               ['module.Class', 'module.other']
+
+        self.graph.remove('test_b.py')
+        assert 'test_b.py' not in self.graph
+        assert self.graph.callers == {'module.other': set(['test_a.py'])}
+
+
+class TestSharedCallGraph(object):
+    def setUp(self):
+        self.test_file = tempfile.mktemp(suffix='.py')
+        self.analysis = AnalysisCache()
+
+    def tearDown(self):
+        os.unlink(self.test_file)
+
+    def _reached(self):
+        graph = self.analysis.call_graph([self.test_file])
+        assert self.analysis.call_graph([self.test_file]) is graph
+        return graph.reached([self.test_file],
+                             ['module.function', 'module.other'])[self.test_file]
+
+    def test_calls_resolved_and_updated(self):
+        dump_str_to_file("from package.module import function\n"
+                         "def test():\n"
+                         "    function()\n", self.test_file)
+        assert self._reached() == ['module.function']
+
+        dump_str_to_file("import package.module as m\n"
+                         "def test():\n"
+                         "    m.other()\n", self.test_file)
+        # Not analyzed again until told so.
+        assert self._reached() == ['module.function']
+        self.analysis.invalidate(self.test_file)
+        assert self._reached() == ['module.other']
+
+    def test_attribute_calls_not_resolved(self):
+        dump_str_to_file("def test(self):\n"
+                         "    self.module.function()\n"
+                         "    helper.module.other()\n", self.test_file)
+        assert self._reached() == []
+
+
+class TestParserCache(object):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.cache_dir)
+
+    def test_cached_results(self):
+        parser_cache = DiskCache(self.cache_dir)
+
+        code = AnalysisCache(parser_cache=parser_cache).source_file(MODULE1_PATH).code
+        cached = AnalysisCache(parser_cache=parser_cache).source_file(MODULE1_PATH).code
+
+        assert code.system is not None
+        assert cached.system is None
+        assert cached.summary() == code.summary()
+        assert cached.object_count() == code.object_count()
+        assert cached.docstring_count_by_type('epytext') == 3
+        assert set(cached.functions_called) == set(code.functions_called)
+
+    def test_module_name_in_key(self):
+        parser_cache = DiskCache(self.cache_dir)
+        module2_path = os.path.join(self.cache_dir, "module2.py")
+        shutil.copy(MODULE1_PATH, module2_path)
+
+        AnalysisCache(parser_cache=parser_cache).source_file(MODULE1_PATH).code
+        code = AnalysisCache(parser_cache=parser_cache).source_file(module2_path).code
+
+        assert code.modules == ["module2"]
+
+
+class TestParallelParsing(object):
+    def test_parse_in_pool(self):
+        paths = map(lambda x: os.path.join(DATA_PATH, x),
+                    ["module1.py", "import_self.py"])
+
+        serial = AnalysisCache()
+        serial.parse(paths)
+        parallel = AnalysisCache()
+        parallel.parse(paths, jobs=2)
+
+        for path in paths:
+            assert parallel.source_file(path).code.summary() == \
+                   serial.source_file(path).code.summary()
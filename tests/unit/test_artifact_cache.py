@@ -0,0 +1,107 @@
+import os
+import tempfile
+import time
+
+import _path_cheesecake
+from _helper_cheesecake import SAMPLE_PACKAGE_URL, dump_str_to_file
+from _helper_cheesecake import mocked_urlretrieve
+
+import cheesecake.cheesecake_index as cheesecake_index
+from cheesecake.cheesecake_index import Cheesecake
+from cheesecake.util import ArtifactCache, rmtree
+
+
+class TestArtifactCache(object):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.destination = os.path.join(self.temp_dir, 'sandbox')
+        os.mkdir(self.destination)
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def _file(self, name, contents):
+        path = os.path.join(self.temp_dir, name)
+        dump_str_to_file(contents, path)
+        return path
+
+    def _objects(self, cache):
+        return os.listdir(cache.objects)
+
+    def test_put_and_get(self):
+        cache = ArtifactCache(self.cache_dir, 1000)
+        cache.put('key', self._file('pkg-1.0.tar.gz', 'contents'),
+                  {'download_url': 'http://host/pkg-1.0.tar.gz'})
+
+        path, metadata = cache.get('key', self.destination)
+
+        assert path == os.path.join(self.destination, 'pkg-1.0.tar.gz')
+        assert open(path).read() == 'contents'
+        assert metadata == {'download_url': 'http://host/pkg-1.0.tar.gz'}
+        assert cache.get('other key', self.destination) is None
+
+    def test_same_contents_stored_once(self):
+        cache = ArtifactCache(self.cache_dir, 1000)
+        cache.put('first', self._file('a.tar.gz', 'contents'))
+        cache.put('second', self._file('b.tar.gz', 'contents'))
+
+        assert len(self._objects(cache)) == 1
+        assert cache.get('second', self.destination)[0].endswith('b.tar.gz')
+
+    def test_least_recently_used_evicted(self):
+        cache = ArtifactCache(self.cache_dir, 25)
+        cache.put('old', self._file('old.tar.gz', 'o' * 10))
+        cache.put('used', self._file('used.tar.gz', 'u' * 10))
+        # Make sure modification times differ.
+        past = time.time() - 100
+        for name in self._objects(cache):
+            os.utime(os.path.join(cache.objects, name), (past, past))
+        os.utime(os.path.join(cache.objects, cache.refs.get('old')[0]),
+                 (past - 10, past - 10))
+
+        assert cache.get('used', self.destination) is not None
+        cache.put('new', self._file('new.tar.gz', 'n' * 10))
+
+        assert len(self._objects(cache)) == 2
+        assert cache.get('old', self.destination) is None
+        assert cache.get('new', self.destination) is not None
+        # Keys of evicted files are gone too.
+        assert sorted(cache.refs.keys()) == ['new', 'used']
+
+    def test_max_age(self):
+        cache = ArtifactCache(self.cache_dir, 1000)
+        cache.put('key', self._file('pkg-1.0.tar.gz', 'contents'))
+        digest, filename, metadata, stored = cache.refs.get('key')
+        cache.refs.set('key', (digest, filename, metadata, stored - 100))
+
+        assert cache.get('key', self.destination, 200) is not None
+        assert cache.get('key', self.destination, 50) is None
+
+
+class TestCachedDownload(object):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.calls = []
+        def urlretrieve(url, filename, headers=None):
+            self.calls.append(url)
+            return mocked_urlretrieve(url, filename, headers)
+        cheesecake_index.urlretrieve = urlretrieve
+
+    def tearDown(self):
+        rmtree(self.cache_dir)
+
+    def _download(self):
+        cheesecake = Cheesecake(url=SAMPLE_PACKAGE_URL, quiet=True,
+                                cache_dir=self.cache_dir)
+        try:
+            assert cheesecake.downloaded_from_url
+            assert os.path.isfile(cheesecake.sandbox_pkg_file)
+            return os.path.getsize(cheesecake.sandbox_pkg_file)
+        finally:
+            cheesecake.cleanup()
+
+    def test_download_cached(self):
+        size = self._download()
+        assert self._download() == size
+        assert self.calls == [SAMPLE_PACKAGE_URL]
@@ -1,9 +1,31 @@
 import os
+import re
+import tempfile
 
 import _path_cheesecake
-from _helper_cheesecake import set, DATA_PATH
+from _helper_cheesecake import set, DATA_PATH, dump_str_to_file
 
 from cheesecake.codeparser import CodeParser, use_format
+from cheesecake.codeparser import find_formats, supported_formats
+from cheesecake.util import rmtree
+
+
+prefixed_module = """
+import os.path as p
+
+class Foo:
+    def method(self):
+        "Method calling things."
+        p.join('a', 'b')
+        def helper():
+            connect()
+
+def FooBar():
+    self.parser.parse()
+
+def Foo_function():
+    pass
+"""
 
 
 class TestCodeParser(object):
@@ -94,6 +116,36 @@ class TestCodeParser(object):
         assert set(objects_with_javadoc_docstrings) == set(self.code1.docstrings_by_format['javadoc'])
 
 
+class TestMethodsAndFunctions(object):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.module = os.path.join(self.temp_dir, 'prefixed.py')
+        dump_str_to_file(prefixed_module, self.module)
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def test_classified_by_parent(self):
+        code = CodeParser(self.module)
+
+        assert code.methods == ["prefixed.Foo.method"]
+        assert set(code.functions) == set(["prefixed.Foo.method.helper",
+                                           "prefixed.FooBar",
+                                           "prefixed.Foo_function"])
+        assert set(code.method_func) == set(["prefixed.Foo.method",
+                                             "prefixed.Foo.method.helper",
+                                             "prefixed.FooBar",
+                                             "prefixed.Foo_function"])
+        assert code.docstrings == ["prefixed.Foo.method"]
+
+    def test_references(self):
+        code = CodeParser(self.module)
+
+        assert code.references == ["connect", "os.path.join", "p.join",
+                                   "self.parser.parse"]
+        assert code.imported_references == ["os.path.join"]
+
+
 class TestDocumentationFormats(object):
     def _do_it(self, format, valid, invalid):
         for test in valid:
@@ -164,3 +216,20 @@ class TestDocumentationFormats(object):
         ]
 
         self._do_it('javadoc', valid_test_strings, invalid_test_strings)
+
+
+class TestFindFormats(object):
+    def test_same_as_separate_patterns(self):
+        pieces = ["*emphasis*", "``inline``", "@param x: value", ":class:",
+                  "<b>bold</b>", "{@link Other}", "I{italics}", "\n - item",
+                  "\n1. item", ".. note::", " plain words ", "\n"]
+        texts = [a + b + c for a in pieces for b in pieces for c in pieces]
+
+        for text in texts:
+            expected = []
+            for format, patterns in supported_formats.items():
+                for pattern in patterns:
+                    if re.search(pattern, text):
+                        expected.append(format)
+                        break
+            assert sorted(find_formats(text)) == sorted(expected), text
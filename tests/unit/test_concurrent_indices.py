@@ -0,0 +1,83 @@
+import os
+
+import _path_cheesecake
+from cheesecake.cheesecake_index import Index
+from cheesecake import logger
+
+
+class IndexInPlace(Index):
+    max_value = 10
+
+    def compute(self, number):
+        self.value = number
+        self.details = "computed in %d" % os.getpid()
+        return self.value
+
+
+class IndexInThread(IndexInPlace):
+    concurrency = 'thread'
+
+
+class IndexInProcess(IndexInPlace):
+    concurrency = 'process'
+
+    def compute(self, number):
+        self.add_info("got %d" % number)
+        return IndexInPlace.compute(self, number * 2)
+
+
+class IndexBrokenInProcess(Index):
+    max_value = 10
+    concurrency = 'process'
+
+    def compute(self):
+        raise ValueError("broken")
+
+
+class IndexGroup(Index):
+    subindices = [IndexInPlace, IndexInProcess]
+
+
+class CheesecakeMockup(object):
+    number = 3
+    quiet = True
+    log = logger.MultipleProducer('cheesecake null')
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+
+def make_index():
+    return Index(IndexInThread(), IndexGroup(), IndexBrokenInProcess())
+
+
+class TestConcurrentIndices(object):
+    def test_same_results(self):
+        sequential = make_index()
+        concurrent = make_index()
+
+        assert sequential.compute_with(CheesecakeMockup(jobs=1)) == 12
+        assert concurrent.compute_with(CheesecakeMockup(jobs=4)) == 12
+
+        assert concurrent.max_value == sequential.max_value == 30
+        assert concurrent.get_info() == sequential.get_info()
+        assert map(lambda index: index.name, concurrent.subindices) == \
+               ['IndexInThread', 'IndexGroup']
+
+    def test_computed_in_process(self):
+        index = IndexGroup()
+        index.compute_with(CheesecakeMockup(jobs=2))
+
+        assert index['IndexInPlace'].details == "computed in %d" % os.getpid()
+        assert index['IndexInProcess'].details != \
+               "computed in %d" % os.getpid()
+        assert index['IndexInProcess'].value == 6
+
+    def test_cheesecake_without_jobs(self):
+        class OldCheesecakeMockup(object):
+            number = 3
+            quiet = True
+            log = logger.MultipleProducer('cheesecake null')
+
+        index = make_index()
+        assert index.compute_with(OldCheesecakeMockup()) == 12
@@ -0,0 +1,185 @@
+import os
+import tempfile
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import _path_cheesecake
+from _helper_cheesecake import SAMPLE_PACKAGE_PATH
+
+import cheesecake.cheesecake_index as cheesecake_index
+from cheesecake import downloader
+from cheesecake.cheesecake_index import Cheesecake, CheesecakeError
+from cheesecake.downloader import Downloader, HTTPError, conditional_headers
+from cheesecake.util import rmtree
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FilesHandler(BaseHTTPRequestHandler):
+    """Serve `files` mapping paths to (contents, etag) over keep-alive
+    connections, remembering requests and connections.
+    """
+    protocol_version = 'HTTP/1.1'
+    files = {}
+    # Paths for which only that many bytes are sent before disconnecting.
+    truncated = {}
+    requests = []
+    connections = []
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connections.append(self.client_address)
+
+    def do_GET(self):
+        if_none_match = self.headers.getheader('if-none-match')
+        self.requests.append((self.path, if_none_match))
+        if self.path not in self.files:
+            self._respond(404, 'Not here')
+            return
+        contents, etag = self.files[self.path]
+        if if_none_match == etag:
+            self._respond(304, '', etag)
+        else:
+            self._respond(200, contents, etag, self.truncated.get(self.path))
+
+    def _respond(self, code, contents, etag=None, sent=None):
+        self.send_response(code)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(len(contents)))
+        self.end_headers()
+        if sent is not None:
+            contents = contents[:sent]
+            self.close_connection = 1
+        self.wfile.write(contents)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServerTest(object):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        FilesHandler.files = {'/a.tar.gz': ('a' * 100000, '"a1"'),
+                              '/b.tar.gz': ('b' * 10, '"b1"')}
+        FilesHandler.truncated = {}
+        FilesHandler.requests = []
+        FilesHandler.connections = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FilesHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.downloader = Downloader()
+
+    def tearDown(self):
+        self.downloader.close()
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.temp_dir)
+
+    def _retrieve(self, name, headers=None):
+        return self.downloader.retrieve(self.base_url + '/' + name,
+                                        os.path.join(self.temp_dir, name),
+                                        headers)
+
+
+class TestDownloader(ServerTest):
+    def test_connection_reused(self):
+        for name in ['a.tar.gz', 'b.tar.gz', 'a.tar.gz']:
+            filename, headers = self._retrieve(name)
+            assert open(filename).read() == FilesHandler.files['/' + name][0]
+
+        assert len(FilesHandler.requests) == 3
+        assert len(FilesHandler.connections) == 1
+
+    def test_not_modified(self):
+        filename, headers = self._retrieve('a.tar.gz')
+        assert conditional_headers(headers) == {'If-None-Match': '"a1"'}
+
+        os.unlink(filename)
+        assert self._retrieve('a.tar.gz', conditional_headers(headers))[0] \
+               is None
+        assert not os.path.exists(filename)
+
+        FilesHandler.files['/a.tar.gz'] = ('new', '"a2"')
+        filename, headers = self._retrieve('a.tar.gz',
+                                           conditional_headers(headers))
+        assert open(filename).read() == 'new'
+
+    def test_error_status(self):
+        try:
+            self._retrieve('missing.tar.gz')
+            assert False, "Should raise HTTPError."
+        except HTTPError, e:
+            assert e.code == 404
+            assert e.msg == 'Not Found'
+
+        # Connection is still usable after an error.
+        self._retrieve('b.tar.gz')
+        assert len(FilesHandler.connections) == 1
+
+
+    def test_incomplete_download(self):
+        FilesHandler.truncated['/a.tar.gz'] = 100
+        try:
+            self._retrieve('a.tar.gz')
+            assert False, "Should raise IOError."
+        except IOError, e:
+            assert 'incomplete' in str(e)
+        assert not os.path.exists(os.path.join(self.temp_dir, 'a.tar.gz'))
+
+        # Complete download works afterwards.
+        del FilesHandler.truncated['/a.tar.gz']
+        filename, headers = self._retrieve('a.tar.gz')
+        assert open(filename).read() == FilesHandler.files['/a.tar.gz'][0]
+
+
+class TestCheesecakeDownload(ServerTest):
+    def setUp(self):
+        ServerTest.setUp(self)
+        FilesHandler.files['/nose-0.8.3.tar.gz'] = \
+            (open(SAMPLE_PACKAGE_PATH, 'rb').read(), '"nose1"')
+        self.cache_dir = os.path.join(self.temp_dir, 'cache')
+        self.saved_downloader = downloader.default_downloader
+        downloader.default_downloader = self.downloader
+        cheesecake_index.urlretrieve = downloader.urlretrieve
+
+    def tearDown(self):
+        downloader.default_downloader = self.saved_downloader
+        ServerTest.tearDown(self)
+
+    def _download(self, name):
+        cheesecake = Cheesecake(url=self.base_url + '/' + name, quiet=True,
+                                cache_dir=self.cache_dir)
+        try:
+            return open(cheesecake.sandbox_pkg_file, 'rb').read()
+        finally:
+            cheesecake.cleanup()
+
+    def test_cached_package_revalidated(self):
+        contents = FilesHandler.files['/nose-0.8.3.tar.gz'][0]
+        assert self._download('nose-0.8.3.tar.gz') == contents
+        assert self._download('nose-0.8.3.tar.gz') == contents
+        assert FilesHandler.requests == [('/nose-0.8.3.tar.gz', None),
+                                         ('/nose-0.8.3.tar.gz', '"nose1"')]
+
+    def test_cached_package_unreachable(self):
+        contents = FilesHandler.files['/nose-0.8.3.tar.gz'][0]
+        assert self._download('nose-0.8.3.tar.gz') == contents
+
+        self.downloader.close()
+        self.server.shutdown()
+        self.server.server_close()
+        assert self._download('nose-0.8.3.tar.gz') == contents
+
+    def test_missing_package(self):
+        try:
+            self._download('missing.tar.gz')
+            assert False, "Should throw a CheesecakeError."
+        except CheesecakeError, e:
+            assert "Got '404 Not Found' error" in str(e)
@@ -0,0 +1,89 @@
+import os
+import tempfile
+
+import _path_cheesecake
+from _helper_cheesecake import Glutton, dump_str_to_file
+from cheesecake.cheesecake_index import IndexPEP8
+from cheesecake.util import ThreadCall, rmtree
+from cheesecake import pep8
+
+
+clean_module = """import os
+
+
+def function():
+    return os.getcwd()
+"""
+
+dirty_module = """import os, sys
+def function():
+    return os.getcwd() \n"""
+
+
+class TestPEP8Report(object):
+    def setup(self):
+        self.package_dir = tempfile.mkdtemp()
+        for name, contents in [('clean.py', clean_module),
+                               ('dirty.py', dirty_module)]:
+            dump_str_to_file(contents, os.path.join(self.package_dir, name))
+
+    def teardown(self):
+        rmtree(self.package_dir)
+
+    def _check(self, name):
+        report = pep8.Report(pep8.parse_options(['-qq']))
+        report.input_file(os.path.join(self.package_dir, name))
+        return report
+
+    def test_separate_reports(self):
+        dirty = self._check('dirty.py')
+        clean = self._check('clean.py')
+
+        assert clean.get_statistics() == []
+        assert dirty.get_error_statistics() == [
+            '1       E302 expected 2 blank lines, found 0',
+            '1       E401 multiple imports on one line']
+        assert dirty.get_warning_statistics() == [
+            '1       W291 trailing whitespace']
+        assert dirty.counters['files'] == clean.counters['files'] == 1
+
+    def test_reports_in_threads(self):
+        calls = [ThreadCall(lambda name=name: self._check(name))
+                 for name in ['dirty.py', 'clean.py'] * 4]
+        statistics = [call.result().get_statistics() for call in calls]
+
+        assert statistics == [self._check('dirty.py').get_statistics(),
+                              []] * 4
+
+    def test_index_pep8(self):
+        index = IndexPEP8()
+        index.cheesecake = Glutton()
+        index.compute(['clean.py', 'dirty.py'], self.package_dir, None)
+
+        assert index.details == "pep8.py check: 2 error types, 1 warning types"
+        assert index.value == index.max_value - 2*2 - 1
+
+    def test_input_files_in_pool(self):
+        filenames = [os.path.join(self.package_dir, name)
+                     for name in ['dirty.py', 'clean.py', 'dirty.py']]
+
+        sequential = pep8.Report(pep8.parse_options(['-qq']))
+        sequential.input_files(filenames)
+        pooled = pep8.Report(pep8.parse_options(['-qq']))
+        pooled.input_files(filenames, jobs=2)
+
+        assert pooled.counters == sequential.counters
+        assert pooled.get_statistics() == sequential.get_statistics()
+        assert pooled.counters['files'] == 3
+
+    def test_index_pep8_in_pool(self):
+        indices = []
+        for jobs in [1, 2]:
+            index = IndexPEP8()
+            index.cheesecake = Glutton()
+            index.compute(['clean.py', 'dirty.py'], self.package_dir, None,
+                          jobs)
+            indices.append(index)
+
+        assert indices[0].value == indices[1].value
+        assert indices[0].info == indices[1].info
@@ -1,11 +1,14 @@
 import os
 import shutil
+import sys
 import tempfile
+import time
 
 import nose
 
 import _path_cheesecake
 from _helper_cheesecake import DATA_PATH, Glutton, create_empty_file
+from _helper_cheesecake import create_empty_files_in_directory, dump_str_to_file
 from cheesecake.cheesecake_index import IndexPyLint
 from cheesecake.util import command_successful, rmtree
 from cheesecake import logger
@@ -55,3 +58,132 @@ class TestIndexPyLint(object):
 
         # Clean up.
         rmtree(_package_dir)
+
+
+fake_pylint = """#!/bin/sh
+# Rate module with a number from its name, take a while for slow ones.
+echo $1 >> $0.calls
+case "$1" in
+    *slow*) exec sleep 5;;
+esac
+echo "Your code has been rated at `echo $1 | tr -dc 0-9`.00/10"
+"""
+
+
+class FakePyLintCase(object):
+    "Run tests with PYLINT set to a script given by `fake_pylint`."
+    fake_pylint = fake_pylint
+
+    def setup(self):
+        self.package_dir = tempfile.mkdtemp()
+        self.original_pylint = os.environ.get('PYLINT')
+
+        pylint = os.path.join(self.package_dir, 'fake_pylint')
+        dump_str_to_file(self.fake_pylint, pylint)
+        os.chmod(pylint, 0755)
+        os.environ['PYLINT'] = pylint
+
+    def teardown(self):
+        if self.original_pylint is None:
+            del os.environ['PYLINT']
+        else:
+            os.environ['PYLINT'] = self.original_pylint
+        rmtree(self.package_dir)
+
+
+class TestParallelPyLint(FakePyLintCase):
+    def _compute(self, files_list, max_execution_time, jobs):
+        create_empty_files_in_directory(files_list, self.package_dir)
+
+        index = IndexPyLint()
+        index.cheesecake = Glutton()
+        index.compute(files_list, self.package_dir, max_execution_time, jobs)
+        return index
+
+    def test_scores_are_averaged(self):
+        index = self._compute(['module_2.py', 'module_6.py'], 120, 2)
+
+        assert index.details == "pylint score was 4.00 out of 10"
+        assert index.value == 20
+
+    def test_one_time_budget(self):
+        files_list = ['slow_%d.py' % x for x in range(4)]
+
+        start = time.time()
+        try:
+            self._compute(files_list, 1, 2)
+        except OSError:
+            pass
+        else:
+            raise AssertionError("time budget exceeded, but no error raised")
+
+        # Two rounds of slow modules would take 10 seconds.
+        assert time.time() - start < 4
+
+    def test_cached_ratings(self):
+        cache_dir = os.path.join(self.package_dir, 'cache')
+        files_list = ['module_2.py', 'module_6.py']
+        create_empty_files_in_directory(files_list, self.package_dir)
+
+        index = IndexPyLint()
+        index.cheesecake = Glutton()
+        index.compute(files_list, self.package_dir, 120, 1, cache_dir)
+        assert index.details == "pylint score was 4.00 out of 10"
+
+        # Only the changed module is checked again.
+        calls = os.environ['PYLINT'] + '.calls'
+        os.unlink(calls)
+        dump_str_to_file("# changed\n",
+                         os.path.join(self.package_dir, 'module_6.py'))
+
+        index = IndexPyLint()
+        index.cheesecake = Glutton()
+        index.compute(files_list, self.package_dir, 120, 1, cache_dir)
+        assert index.details == "pylint score was 4.00 out of 10"
+        assert open(calls).read().split() == ['--version', 'module_6.py']
+
+
+weighing_pylint = """#!%s
+# Rate modules named rate_<rating>_<statements>.py as pylint would rate
+# them checked together.
+import sys
+modules = [arg for arg in sys.argv[1:] if arg.startswith('rate_')]
+if '--version' in sys.argv or not modules:
+    sys.exit(0)
+if 'broken' in modules[0]:
+    sys.exit(1)
+penalty = statements = 0
+for module in modules:
+    rating, count = map(int, module[len('rate_'):-len('.py')].split('_'))
+    penalty += (10 - rating) * count
+    statements += count
+print("%%d statements analysed." %% statements)
+if statements:
+    rating = 10 - float(penalty) / statements
+print("Your code has been rated at %%.2f/10" %% rating)
+""" % sys.executable
+
+
+class TestWeightedPyLint(FakePyLintCase):
+    fake_pylint = weighing_pylint
+
+    def test_same_score_in_every_mode(self):
+        files_list = ['rate_2_1.py', 'rate_6_3.py']
+        create_empty_files_in_directory(files_list, self.package_dir)
+        cache_dir = os.path.join(self.package_dir, 'cache')
+
+        for jobs, cache in [(1, None), (2, None), (1, cache_dir),
+                            (1, cache_dir)]:
+            index = IndexPyLint()
+            index.cheesecake = Glutton()
+            index.compute(files_list, self.package_dir, 120, jobs, cache)
+            assert index.details == "pylint score was 5.00 out of 10"
+
+    def test_only_modules_without_statements(self):
+        files_list = ['rate_0_0_broken.py', 'rate_8_0.py']
+        create_empty_files_in_directory(files_list, self.package_dir)
+
+        index = IndexPyLint()
+        index.cheesecake = Glutton()
+        index.compute(files_list, self.package_dir, 120, 2)
+        assert index.details == "pylint score was 8.00 out of 10"
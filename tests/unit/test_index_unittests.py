@@ -29,6 +29,13 @@ class TestSomeFunction:
         different_module.some_module.some_function()
 """
 
+imported_test_contents = test_contents + """
+from package.some_module import other_function
+
+def test_other_function():
+    other_function()
+"""
+
 class TestUnitTestsIndex(object):
     def setUp(self):
         self.project_dir = tempfile.mkdtemp()
@@ -37,12 +44,12 @@ class TestUnitTestsIndex(object):
         if os.path.exists(self.project_dir):
             rmtree(self.project_dir)
 
-    def test_unit_tests_index(self):
+    def _compute(self, contents):
         test_dir = os.path.join(self.project_dir, 'test')
         os.mkdir(test_dir)
 
         test_filename = os.path.join(test_dir, 'test_some_function.py')
-        dump_str_to_file(test_contents, test_filename)
+        dump_str_to_file(contents, test_filename)
 
         logger.setconsumer('console', logger.STDOUT)
         console_log = logger.MultipleProducer('cheesecake console')
@@ -62,4 +69,12 @@ class TestUnitTestsIndex(object):
 
         print("Index: %d/%d -- %s" %
               (index.value, index.max_value, index.details))
+        return index
+
+    def test_unit_tests_index(self):
+        index = self._compute(test_contents)
         assert index.value == int(ceil(index.max_value * 2.0/4.0))
+
+    def test_imported_functions(self):
+        index = self._compute(imported_test_contents)
+        assert index.value == int(ceil(index.max_value * 3.0/4.0))
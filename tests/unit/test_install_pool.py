@@ -0,0 +1,165 @@
+import os
+import tarfile
+import tempfile
+import time
+from cStringIO import StringIO
+
+import _path_cheesecake
+import cheesecake.cheesecake_index as cheesecake_index
+from cheesecake.cheesecake_index import Cheesecake
+from cheesecake.util import InstallRootPool, rmtree
+
+
+setup_py = """from distutils.core import setup
+setup(name='tiny', version='1.0', py_modules=['tiny'])
+"""
+
+hanging_setup_py = """import time
+time.sleep(60)
+"""
+
+failing_setup_py = """import sys
+sys.exit(1)
+"""
+
+greedy_setup_py = """memory = ' ' * (512 * 1024 * 1024)
+""" + setup_py
+
+
+class TestInstallRootPool(object):
+    def setUp(self):
+        self.pool = InstallRootPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reused_and_reset(self):
+        first = self.pool.checkout()
+        second = self.pool.checkout()
+        assert first != second
+
+        os.makedirs(os.path.join(first, 'usr', 'lib'))
+        open(os.path.join(first, 'file.txt'), 'w').close()
+        self.pool.checkin(first)
+
+        assert self.pool.checkout() == first
+        assert os.listdir(first) == []
+
+    def test_foreign_path_ignored(self):
+        self.pool.checkin('/not/from/pool')
+        assert os.path.dirname(self.pool.checkout()) == self.pool.directory
+
+    def test_close(self):
+        self.pool.checkout()
+        self.pool.close()
+        assert not os.path.exists(self.pool.directory)
+
+
+class TestInstallPackage(object):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.package = os.path.join(self.temp_dir, 'tiny-1.0.tar.gz')
+        self._make_package(setup_py)
+
+        self.commands = []
+        self.original_run_cmd = cheesecake_index.run_cmd
+        def run_cmd(cmd, *args, **kwds):
+            if 'setup.py install' in cmd:
+                self.commands.append(cmd)
+            return self.original_run_cmd(cmd, *args, **kwds)
+        cheesecake_index.run_cmd = run_cmd
+
+    def tearDown(self):
+        cheesecake_index.run_cmd = self.original_run_cmd
+        rmtree(self.temp_dir)
+
+    def _make_package(self, setup_py):
+        t = tarfile.open(self.package, 'w:gz')
+        for name, contents in [('tiny-1.0/setup.py', setup_py),
+                               ('tiny-1.0/tiny.py', 'x = 1\n')]:
+            info = tarfile.TarInfo(name)
+            info.size = len(contents)
+            t.addfile(info, StringIO(contents))
+        t.close()
+
+    def _install(self, **options):
+        cheesecake = Cheesecake(path=self.package, quiet=True, **options)
+        try:
+            return (getattr(cheesecake, 'installed', False),
+                    cheesecake.sandbox_install_dir)
+        finally:
+            cheesecake.cleanup()
+
+    def test_install_into_pool(self):
+        pool = InstallRootPool()
+        try:
+            installed, install_dir = self._install(install_pool=pool)
+            assert installed
+            assert os.path.dirname(install_dir) == pool.directory
+            assert pool.busy == set()
+
+            assert self._install(install_pool=pool) == (True, install_dir)
+        finally:
+            pool.close()
+
+    def test_install_result_cached(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+
+        assert self._install(cache_dir=cache_dir)[0]
+        assert self._install(cache_dir=cache_dir)[0]
+        assert len(self.commands) == 1
+
+        # Different package file is installed again.
+        other = os.path.join(self.temp_dir, 'other', 'tiny-1.0.tar.gz')
+        os.mkdir(os.path.dirname(other))
+        open(other, 'wb').write(open(self.package, 'rb').read() + '\0')
+        self.package = other
+        self._install(cache_dir=cache_dir)
+        assert len(self.commands) == 2
+
+    def test_install_cache_keyed_on_limits(self):
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+
+        assert self._install(cache_dir=cache_dir)[0]
+        assert self._install(cache_dir=cache_dir,
+                             install_max_memory=1024 * 1024 * 1024)[0]
+        assert self._install(cache_dir=cache_dir,
+                             install_max_execution_time=600)[0]
+        assert len(self.commands) == 3
+
+        assert self._install(cache_dir=cache_dir,
+                             install_max_execution_time=600)[0]
+        assert len(self.commands) == 3
+
+    def test_default_install_timeout(self):
+        cheesecake = Cheesecake(path=self.package, quiet=True, static_only=True)
+        try:
+            assert cheesecake.install_max_execution_time == 300
+        finally:
+            cheesecake.cleanup()
+
+    def test_failed_install_not_cached(self):
+        self._make_package(failing_setup_py)
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+
+        assert not self._install(cache_dir=cache_dir)[0]
+        assert not self._install(cache_dir=cache_dir)[0]
+        assert len(self.commands) == 2
+
+    def test_install_timeout(self):
+        self._make_package(hanging_setup_py)
+        cache_dir = os.path.join(self.temp_dir, 'cache')
+
+        start = time.time()
+        assert not self._install(cache_dir=cache_dir,
+                                 install_max_execution_time=1)[0]
+        assert time.time() - start < 30
+
+        # Installation which ran out of time is tried again.
+        self._install(cache_dir=cache_dir, install_max_execution_time=1)
+        assert len(self.commands) == 2
+
+    def test_install_memory_limit(self):
+        self._make_package(greedy_setup_py)
+
+        assert not self._install(install_max_memory=128 * 1024 * 1024)[0]
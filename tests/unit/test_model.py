@@ -0,0 +1,122 @@
+import cPickle as pickle
+
+import _path_cheesecake
+from cheesecake.model import EMPTY_DICT, EMPTY_LIST, System, fromText
+
+
+module_source = """
+import os.path as p
+from sys import argv
+
+class Base(object):
+    def method(self, x=1):
+        import re
+
+class Derived(Base):
+    if True:
+        def method(self):
+            pass
+    else:
+        def method(self):
+            pass
+"""
+
+
+class TestModel(object):
+    def setUp(self):
+        self.module = fromText(module_source, 'mod')
+        self.system = self.module.system
+
+    def test_no_instance_dictionaries(self):
+        for obj in self.system.orderedallobjects:
+            assert not hasattr(obj, '__dict__')
+
+    def test_shared_empty_containers(self):
+        method = self.system.allobjects['mod.Derived.method']
+        assert method.contents is EMPTY_DICT
+        assert method.orderedcontents is EMPTY_LIST
+        assert method._name2fullname is EMPTY_DICT
+        try:
+            EMPTY_DICT['name'] = 'value'
+            assert False, "Should raise TypeError."
+        except TypeError:
+            pass
+
+        assert self.module._name2fullname['p'] == 'os.path'
+        assert self.module._name2fullname['argv'] == 'sys.argv'
+        assert self.system.allobjects['mod.Base.method']._name2fullname == \
+               {'re': 're'}
+
+    def test_full_name_follows_renaming(self):
+        assert sorted(self.system.allobjects) == \
+               ['mod', 'mod.Base', 'mod.Base.method', 'mod.Derived',
+                'mod.Derived.method', 'mod.Derived.method 0']
+        for fullname, obj in self.system.allobjects.items():
+            assert obj.fullName() == fullname
+
+    def test_pickle(self):
+        for protocol in [0, pickle.HIGHEST_PROTOCOL]:
+            system = pickle.loads(pickle.dumps(self.system, protocol))
+
+            assert sorted(system.allobjects) == sorted(self.system.allobjects)
+            base = system.allobjects['mod.Base']
+            derived = system.allobjects['mod.Derived']
+            assert derived.baseobjects == [base]
+            assert base.subclasses == [derived]
+            assert base.parent is system.allobjects['mod']
+            assert base.contents['method'].argspec == \
+                   (['self', 'x'], None, None, ('1',))
+            assert system.allobjects['mod.Derived.method 0'].fullName() == \
+                   'mod.Derived.method 0'
+
+
+syntax_source = """
+from . import sibling
+from ..parent import name as alias
+
+@decorator(call_in_decorator())
+def function(a, (b, c), d=[1, 2], e=-1, f=lambda x, y=2: x * y, *args, **kw):
+    "Function docstring."
+    exec "code" in namespace
+    helper().method()
+    os.path.join(a, b)
+    def nested():
+        nested_call()
+    if a:
+        class Local(Base):
+            pass
+"""
+
+
+class TestSyntaxTree(object):
+    def setUp(self):
+        self.module = fromText(syntax_source, 'mod')
+        self.system = self.module.system
+
+    def test_objects(self):
+        assert [(obj.kind, obj.fullName())
+                for obj in self.system.orderedallobjects] == \
+               [('Module', 'mod'), ('Function', 'mod.function'),
+                ('Function', 'mod.function.nested'),
+                ('Class', 'mod.function.Local')]
+        assert self.system.allobjects['mod.function'].docstring == \
+               "Function docstring."
+        assert self.system.allobjects['mod.function.Local'].rawbases == \
+               ['Base']
+
+    def test_relative_imports(self):
+        assert self.module._name2fullname == \
+               {'sibling': '.sibling', 'alias': 'parent.name',
+                'function': 'mod.function'}
+
+    def test_argspec(self):
+        function = self.system.allobjects['mod.function']
+        assert function.linenumber == 5
+        assert function.argspec == \
+               (['a', ['b', 'c'], 'd', 'e', 'f'], 'args', 'kw',
+                ('[1, 2]', '-1', 'lambda x, y=2: x * y'))
+
+    def test_function_calls(self):
+        assert sorted(self.system.func_called) == \
+               ['None.method', 'call_in_decorator', 'decorator', 'helper',
+                'nested_call', 'os.path.join']
@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+import _path_cheesecake
+from _helper_cheesecake import SAMPLE_PACKAGE_PATH
+from cheesecake.cheesecake_index import Cheesecake, CheesecakeIndex
+from cheesecake.cheesecake_index import get_files_dirs_list, is_empty
+from cheesecake.cheesecake_index import index_values
+from cheesecake.util import read_tar_package, untar_package, rmtree
+
+
+class TestPackageContents(object):
+    def setUp(self):
+        self.sandbox = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.sandbox)
+
+    def test_same_as_extracted(self):
+        contents = read_tar_package(SAMPLE_PACKAGE_PATH)
+        files, dirs, empty, sources = contents.listing()
+
+        unpack_dir = untar_package(SAMPLE_PACKAGE_PATH, self.sandbox)
+        package_dir = os.path.join(self.sandbox, unpack_dir)
+        extracted_files, extracted_dirs = get_files_dirs_list(package_dir)
+
+        assert contents.unpack_dir == unpack_dir
+        assert sorted(files) == sorted(extracted_files)
+        assert sorted(dirs) == sorted(extracted_dirs)
+        for name in files + dirs:
+            assert (name in empty) == is_empty(os.path.join(package_dir, name))
+        for name, source in sources.iteritems():
+            assert source == open(os.path.join(package_dir, name)).read()
+
+    def test_invalid_package(self):
+        invalid = os.path.join(self.sandbox, 'invalid.tar.gz')
+        open(invalid, 'w').write('not a tarball')
+
+        assert read_tar_package(invalid) is None
+
+
+class TestStreamingCheesecake(object):
+    def _score(self, **options):
+        cheesecake = Cheesecake(path=SAMPLE_PACKAGE_PATH, static_only=True,
+                                lite=True, quiet=True, with_pep8=True,
+                                **options)
+        cheesecake.index.compute_with(cheesecake)
+        return cheesecake
+
+    def test_not_extracted(self):
+        cheesecake = self._score()
+        try:
+            assert cheesecake.package_contents is not None
+            assert not os.path.exists(cheesecake.package_dir)
+            streamed_values = index_values(cheesecake.index)
+        finally:
+            cheesecake.cleanup()
+
+        # Force extraction and compare scores.
+        CheesecakeIndex.requires_extraction = True
+        try:
+            cheesecake = self._score()
+        finally:
+            del CheesecakeIndex.requires_extraction
+        try:
+            assert cheesecake.package_contents is None
+            assert os.path.isdir(cheesecake.package_dir)
+            assert index_values(cheesecake.index) == streamed_values
+        finally:
+            cheesecake.cleanup()
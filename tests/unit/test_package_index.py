@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from BaseHTTPServer import HTTPServer
+from SimpleHTTPServer import SimpleHTTPRequestHandler
+
+import _path_cheesecake
+from _helper_cheesecake import SAMPLE_PACKAGE_PATH, dump_str_to_file
+
+import cheesecake.cheesecake_index as cheesecake_index
+from cheesecake.cheesecake_index import Cheesecake
+from cheesecake.util import rmtree
+
+
+class IndexRequestHandler(SimpleHTTPRequestHandler):
+    """Serve files from `root` directory and remember requested paths.
+    """
+    root = None
+    requests = []
+
+    def translate_path(self, path):
+        path = path.split('?')[0].split('#')[0]
+        return os.path.join(self.root, *filter(None, path.split('/')))
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        SimpleHTTPRequestHandler.do_GET(self)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def add_project(root, name, filename):
+    project_dir = os.path.join(root, 'simple', name)
+    os.makedirs(project_dir)
+    dump_str_to_file('<html><body><a href="../../packages/%s">%s</a>'
+                     '</body></html>' % (filename, filename),
+                     os.path.join(project_dir, 'index.html'))
+
+
+class TestSharedPackageIndex(object):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'packages'))
+
+        # Source package.
+        add_project(self.root, 'nose', 'nose-0.8.3.tar.gz')
+        shutil.copy(SAMPLE_PACKAGE_PATH,
+                    os.path.join(self.root, 'packages'))
+
+        # Package available only as an egg.
+        add_project(self.root, 'eggonly', 'eggonly-1.0-py2.7.egg')
+        egg = zipfile.ZipFile(os.path.join(self.root, 'packages',
+                                           'eggonly-1.0-py2.7.egg'), 'w')
+        egg.writestr('eggonly/__init__.py', '')
+        egg.writestr('EGG-INFO/PKG-INFO', 'Name: eggonly\nVersion: 1.0\n')
+        egg.close()
+
+        IndexRequestHandler.root = self.root
+        IndexRequestHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), IndexRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.index_url = 'http://127.0.0.1:%d/simple/' % \
+                         self.server.server_address[1]
+
+        self.saved_indices = cheesecake_index.package_indices.copy()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        rmtree(self.root)
+        cheesecake_index.package_indices.clear()
+        cheesecake_index.package_indices.update(self.saved_indices)
+
+    def _download(self, name):
+        cheesecake = Cheesecake(name=name, index_url=self.index_url,
+                                quiet=True, lite=True, static_only=True)
+        try:
+            assert os.path.isfile(cheesecake.sandbox_pkg_file)
+            return cheesecake.package
+        finally:
+            cheesecake.cleanup()
+
+    def _requests_for(self, path):
+        return IndexRequestHandler.requests.count(path)
+
+    def test_pages_read_once_in_all_modes(self):
+        assert self._download('eggonly') == 'eggonly-1.0-py2.7.egg'
+        assert self._requests_for('/simple/eggonly/') == 1
+
+    def test_pages_read_once_for_many_packages(self):
+        for i in range(2):
+            assert self._download('nose') == 'nose-0.8.3.tar.gz'
+        assert self._download('eggonly') == 'eggonly-1.0-py2.7.egg'
+
+        assert self._requests_for('/simple/nose/') == 1
+        assert self._requests_for('/simple/eggonly/') == 1
+        # Packages themselves are downloaded each time.
+        assert self._requests_for('/packages/nose-0.8.3.tar.gz') == 2
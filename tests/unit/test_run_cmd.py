@@ -0,0 +1,77 @@
+import os
+import sys
+import tempfile
+import time
+
+import _path_cheesecake
+from _helper_cheesecake import dump_str_to_file
+from cheesecake import util
+from cheesecake.util import run_cmd, rmtree
+
+
+class TestRunCmd(object):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def _script(self, source):
+        path = os.path.join(self.temp_dir, 'script.py')
+        dump_str_to_file(source, path)
+        return "%s %s" % (sys.executable, path)
+
+    def test_output_and_return_code(self):
+        cmd = self._script("import sys\n"
+                           "sys.stdout.write('out ')\n"
+                           "sys.stdout.flush()\n"
+                           "sys.stderr.write('err')\n"
+                           "sys.exit(3)\n")
+        assert run_cmd(cmd) == (3, 'out err')
+
+    def test_large_output(self):
+        cmd = self._script("import sys\n"
+                           "sys.stdout.write('x' * 1000000)\n")
+        assert run_cmd(cmd, max_timeout=30) == (0, 'x' * 1000000)
+
+    def test_quick_command_not_delayed(self):
+        start = time.time()
+        for i in range(10):
+            assert run_cmd('/bin/true', max_timeout=30) == (0, '')
+        # Each call used to take at least 0.1 second.
+        assert time.time() - start < 1
+
+    def test_timeout(self):
+        cmd = self._script("import time\n"
+                           "time.sleep(30)\n")
+        start = time.time()
+        assert run_cmd(cmd, max_timeout=0.5) == (1, 'Time exceeded')
+        assert time.time() - start < 10
+
+    def test_killed_when_ignoring_interrupt(self):
+        cmd = self._script("import signal, time\n"
+                           "signal.signal(signal.SIGINT, signal.SIG_IGN)\n"
+                           "time.sleep(30)\n")
+        original_kill_timeout = util.KILL_TIMEOUT
+        util.KILL_TIMEOUT = 0.5
+        try:
+            start = time.time()
+            assert run_cmd(cmd, max_timeout=0.5) == (1, 'Time exceeded')
+            assert time.time() - start < 10
+        finally:
+            util.KILL_TIMEOUT = original_kill_timeout
+
+    def test_background_child_holding_output(self):
+        cmd = self._script("import subprocess, sys\n"
+                           "subprocess.Popen(['sleep', '5'])\n"
+                           "sys.stdout.write('done')\n"
+                           "sys.exit(2)\n")
+        for max_timeout in [30, None]:
+            start = time.time()
+            assert run_cmd(cmd, max_timeout=max_timeout) == (2, 'done')
+            assert time.time() - start < 3
+
+    def test_missing_command(self):
+        rc, output = run_cmd('this-command-doesnt-exist')
+        assert rc == 1
+        assert isinstance(output, Exception)
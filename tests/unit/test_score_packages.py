@@ -0,0 +1,102 @@
+import os
+import re
+import sys
+import tempfile
+from StringIO import StringIO
+
+import _path_cheesecake
+from _helper_cheesecake import DATA_PATH
+from cheesecake.cheesecake_index import Cheesecake, CheesecakeError
+from cheesecake.cheesecake_index import CheesecakeIndex
+from cheesecake.cheesecake_index import score_packages, index_values
+
+
+class TestScorePackages(object):
+    def setUp(self):
+        self.logfile = tempfile.mktemp()
+
+    def tearDown(self):
+        if os.path.exists(self.logfile):
+            os.unlink(self.logfile)
+
+    def test_score_packages(self):
+        packages = [{'path': os.path.join(DATA_PATH, "package1.tar.gz")},
+                    {'path': os.path.join(DATA_PATH, "invalid_package.tar.gz"),
+                     'logfile': self.logfile}]
+
+        results = list(score_packages(packages, static_only=True, lite=True))
+
+        assert len(results) == 2
+
+        package, index, error = results[0]
+        assert package == packages[0]
+        assert error is None
+        assert isinstance(index, CheesecakeIndex)
+        assert index.value == sum(map(lambda x: x.value, index.subindices))
+        assert index["INSTALLABILITY"]["IndexUnpack"].value == \
+               index["INSTALLABILITY"]["IndexUnpack"].max_value
+
+        values = index_values(index)
+        assert values['OVERALL CHEESECAKE INDEX (ABSOLUTE)'] == index.value
+        assert values['unpack'] == index["INSTALLABILITY"]["IndexUnpack"].value
+
+        package, index, error = results[1]
+        assert package == packages[1]
+        assert index is None
+        assert isinstance(error, CheesecakeError)
+
+    def test_score_packages_in_processes(self):
+        packages = [{'path': os.path.join(DATA_PATH, name)}
+                    for name in ["package1.tar.gz", "invalid_package.tar.gz",
+                                 "package2.tar.gz", "module1.tar.gz"]]
+
+        sequential = list(score_packages(packages, static_only=True,
+                                         lite=True))
+        parallel = list(score_packages(packages, package_jobs=2,
+                                       static_only=True, lite=True))
+
+        # Parallel results come in order in which packages were scored.
+        assert sorted(map(lambda result: result[0]['path'], parallel)) == \
+               sorted(map(lambda package: package['path'], packages))
+        parallel.sort(key=lambda result: packages.index(result[0]))
+        for (package, index, error), (_, expected, expected_error) in \
+                zip(parallel, sequential):
+            if expected is None:
+                assert index is None
+                assert isinstance(error, CheesecakeError)
+            else:
+                assert index_values(index) == index_values(expected)
+
+    def test_unexpected_error_recorded(self):
+        packages = [{'path': os.path.join(DATA_PATH, "package1.tar.gz"),
+                     'sandbox': 42},
+                    {'path': os.path.join(DATA_PATH, "package2.tar.gz")}]
+
+        results = list(score_packages(packages, static_only=True, lite=True))
+
+        package, index, error = results[0]
+        assert index is None
+        assert isinstance(error, CheesecakeError)
+        assert 'Traceback' in str(error)
+        assert results[1][2] is None
+
+    def test_values_named_as_printed(self):
+        cheesecake = Cheesecake(path=os.path.join(DATA_PATH, "package1.tar.gz"),
+                                static_only=True, lite=True,
+                                logfile=self.logfile)
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            cheesecake.compute_cheesecake_index()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            cheesecake.cleanup()
+
+        printed = {}
+        for line in output.splitlines():
+            m = re.search(r'^(\S.*?) \.+\s+(-?\d+)', line)
+            if m:
+                printed[m.group(1)] = int(m.group(2))
+        assert printed
+        assert index_values(cheesecake.index) == printed
@@ -0,0 +1,119 @@
+import os
+import tarfile
+import tempfile
+import zipfile
+from cStringIO import StringIO
+
+import _path_cheesecake
+from cheesecake.util import untar_package, unzip_package, rmtree
+
+
+members = [('pkg/setup.py', 'from distutils.core import setup\n'),
+           ('pkg/data.bin', 'x' * 1000),
+           ('../outside.txt', 'evil')]
+
+
+class TestUnpackPackage(object):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.destination = os.path.join(self.temp_dir, 'sandbox')
+        os.mkdir(self.destination)
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+
+    def _make_tar(self):
+        package = os.path.join(self.temp_dir, 'pkg.tar.gz')
+        t = tarfile.open(package, 'w:gz')
+        for name, contents in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(contents)
+            t.addfile(info, StringIO(contents))
+        link = tarfile.TarInfo('pkg/passwd')
+        link.type = tarfile.SYMTYPE
+        link.linkname = '/etc/passwd'
+        t.addfile(link)
+        t.close()
+        return package
+
+    def _make_chained_links_tar(self):
+        package = os.path.join(self.temp_dir, 'links.tar.gz')
+        t = tarfile.open(package, 'w:gz')
+        for name in ['pkg/b', 'pkg/b/c']:
+            link = tarfile.TarInfo(name)
+            link.type = tarfile.SYMTYPE
+            link.linkname = '..'
+            t.addfile(link)
+        info = tarfile.TarInfo('pkg/b/c/evil.txt')
+        info.size = 4
+        t.addfile(info, StringIO('evil'))
+        t.close()
+        return package
+
+    def _make_zip(self):
+        package = os.path.join(self.temp_dir, 'pkg.zip')
+        z = zipfile.ZipFile(package, 'w')
+        for name, contents in members:
+            z.writestr(name, contents)
+        z.close()
+        return package
+
+    def _check_unpacked(self, unpack, package):
+        stats = {'written': 0, 'skipped': 0}
+        skip_data = lambda name, size: name.endswith('.bin')
+
+        assert unpack(package, self.destination, skip_data, stats) == 'pkg'
+
+        setup_py = os.path.join(self.destination, 'pkg', 'setup.py')
+        assert open(setup_py).read() == members[0][1]
+
+        # Skipped file keeps its size.
+        data_bin = os.path.join(self.destination, 'pkg', 'data.bin')
+        assert os.path.getsize(data_bin) == 1000
+        assert open(data_bin).read() != members[1][1]
+
+        assert not os.path.exists(os.path.join(self.temp_dir, 'outside.txt'))
+        assert not os.path.lexists(os.path.join(self.destination, 'pkg',
+                                                'passwd'))
+
+        assert stats == {'written': len(members[0][1]), 'skipped': 1004}
+
+    def test_untar_package(self):
+        self._check_unpacked(untar_package, self._make_tar())
+
+    def test_unzip_package(self):
+        self._check_unpacked(unzip_package, self._make_zip())
+
+    def test_untar_everything(self):
+        package = self._make_tar()
+
+        assert untar_package(package, self.destination) == 'pkg'
+
+        data_bin = os.path.join(self.destination, 'pkg', 'data.bin')
+        assert open(data_bin).read() == members[1][1]
+
+    def test_untar_chained_links(self):
+        untar_package(self._make_chained_links_tar(), self.destination)
+
+        assert not os.path.exists(os.path.join(self.temp_dir, 'evil.txt'))
+        assert not os.path.exists(os.path.join(self.destination, 'evil.txt'))
+
+    def test_unzip_in_chunks(self):
+        data = ''.join(map(chr, range(256))) * 4096 * 3
+        package = os.path.join(self.temp_dir, 'big.zip')
+        z = zipfile.ZipFile(package, 'w', zipfile.ZIP_DEFLATED)
+        z.writestr('pkg/big.dat', data)
+        z.close()
+
+        # Members must not be read into memory as a whole.
+        def read(self, name, pwd=None):
+            raise AssertionError("ZipFile.read called for %s" % name)
+        original_read = zipfile.ZipFile.read
+        zipfile.ZipFile.read = read
+        try:
+            assert unzip_package(package, self.destination) == 'pkg'
+        finally:
+            zipfile.ZipFile.read = original_read
+
+        big_dat = os.path.join(self.destination, 'pkg', 'big.dat')
+        assert open(big_dat, 'rb').read() == data